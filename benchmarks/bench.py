@@ -0,0 +1,217 @@
+"""
+Measure the overhead of every NanoPDB version/backend against bare Python.
+
+Each workload in `benchmarks/workloads` is run non-interactively (the console commands are fed
+through stdin) with no breakpoint, with a breakpoint that is never hit, with a conditional
+breakpoint on the hottest line whose condition is never true, and with a logpoint on that line.
+Every command is also run with the argument 0, which does no work, and that start-up time (interpreter,
+debugger imports, compiling the script) is subtracted: slowdowns and events per second are those of the
+work itself. The default arguments take about 1s each under bare Python, so a full run of the slow
+V1 and V2 takes a while, see --backends and --quick.
+Lines are tagged in the workloads:
+    # bench: unhit
+    # bench: hot <condition>
+The results are printed as JSON. With --baseline, slowdowns that regressed by more than
+--max-regression compared to an earlier JSON report make the run fail.
+
+usage:
+    python benchmarks/bench.py [--quick] [--repeat N] [--backends v3,v4] [--baseline old.json]
+"""
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKLOADS_DIR = Path(__file__).resolve().parent / "workloads"
+
+# workload -> (default argument, --quick argument)
+WORKLOADS = {
+    "fib": ("33", "16"),
+    "loops": ("12000000", "20000"),
+    "calls": ("5000000", "5000"),
+    # rounds of importing 18 stdlib modules
+    "imports": ("8", "1"),
+}
+# the argument that makes every workload do nothing, to time the start-up alone
+STARTUP_ARG = "0"
+
+BACKENDS = ["v0", "v1", "v2", "v3", "v4", "v5"]
+SCENARIOS = ["zero", "unhit", "conditional", "logpoint"]
+
+
+def _markers(script: Path) -> Dict[str, tuple]:
+    markers = {}
+    for lineno, line in enumerate(script.read_text().splitlines(), start=1):
+        if "# bench: unhit" in line:
+            markers["unhit"] = (lineno, None)
+        elif "# bench: hot" in line:
+            markers["conditional"] = (lineno, line.split("# bench: hot", 1)[1].strip())
+    return markers
+
+
+def _commands(backend: str, scenario: str, script: Path) -> Optional[str]:
+    """console input that sets up the scenario, or None if the backend cannot express it"""
+    if backend == "v0":
+        # static breakpoints only, and no entrance break reading the console
+        return "" if scenario == "zero" else None
+    if scenario == "zero":
+        return "cont()\n"
+    if scenario == "logpoint":
+        if backend in ("v1", "v2"):
+            return None
+        # log the (never true) condition of the hot line on every hit
+        line, condition = _markers(script)["conditional"]
+        message = "{" + condition + "}"
+        return (
+            f"log_at_file_line({script.name!r}, {line}, {message!r})\n"
+            f"log_to({os.devnull!r})\ncont()\n"
+        )
+    line, condition = _markers(script)[scenario]
+    # breakpoints are given by the name the main script is compiled under
+    if condition is None:
+        return f"break_at_file_line({script.name!r}, {line})\ncont()\n"
+    if backend == "v1":
+        return None
+    return f"break_at_file_line({script.name!r}, {line}, {condition!r})\ncont()\n"
+
+
+def _time(cmd: List[str], stdin: str, env: dict, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            cmd, input=stdin, env=env, cwd=ROOT, text=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed:\n{proc.stderr}")
+        best = min(best, elapsed)
+    return best
+
+
+def _count_events(script: Path, arg: str) -> int:
+    """number of call and line events a settrace debugger sees for the workload, its start-up included"""
+    proc = subprocess.run(
+        [sys.executable, __file__, "--count-events", str(script), arg],
+        cwd=ROOT, text=True, capture_output=True, check=True,
+    )
+    return int(proc.stdout.strip().splitlines()[-1])
+
+
+def count_events(script: str, arg: str):
+    counter = {"events": 0}
+
+    def trace(frame, event, _arg):
+        counter["events"] += 1
+        return trace
+
+    sys.argv = [script, arg]
+    sys.settrace(trace)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        sys.settrace(None)
+    print(counter["events"])
+
+
+def _available(backend: str) -> bool:
+    return backend != "v4" or hasattr(sys, "monitoring")
+
+
+def run(args) -> dict:
+    env = dict(os.environ, PYTHONPATH=str(ROOT) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    results = []
+    for name in args.workloads:
+        script = WORKLOADS_DIR / f"{name}.py"
+        arg = WORKLOADS[name][1 if args.quick else 0]
+        bare = _time([sys.executable, str(script), arg], "", env, args.repeat)
+        bare_work = bare - _time([sys.executable, str(script), STARTUP_ARG], "", env, args.repeat)
+        events = _count_events(script, arg) - _count_events(script, STARTUP_ARG)
+        for backend in args.backends:
+            for scenario in SCENARIOS:
+                result = {"workload": name, "backend": backend, "scenario": scenario}
+                stdin = _commands(backend, scenario, script)
+                if stdin is None or not _available(backend):
+                    results.append(dict(result, skipped=True))
+                    continue
+                cmd = [sys.executable, "-m", "nanopdb", str(script.relative_to(ROOT))]
+                backend_env = dict(env, NANOPDB_VERSION=backend[1:])
+                seconds = _time(cmd + [arg], stdin, backend_env, args.repeat)
+                startup = _time(cmd + [STARTUP_ARG], stdin, backend_env, args.repeat)
+                # noise can make the difference of two small times negative
+                work = max(seconds - startup, 1e-4)
+                slowdown = work / max(bare_work, 1e-4)
+                results.append(
+                    dict(
+                        result,
+                        seconds=round(seconds, 4),
+                        startup_seconds=round(startup, 4),
+                        work_seconds=round(work, 4),
+                        bare_seconds=round(bare, 4),
+                        bare_work_seconds=round(bare_work, 4),
+                        slowdown=round(slowdown, 2),
+                        events=events,
+                        events_per_sec=round(events / work),
+                    )
+                )
+                print(f"{name:8} {backend} {scenario:12} x{slowdown:.2f}", file=sys.stderr)
+    return {
+        "python": sys.version.split()[0],
+        "quick": args.quick,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def regressions(report: dict, baseline: dict, max_regression: float) -> List[str]:
+    old = {
+        (r["workload"], r["backend"], r["scenario"]): r["slowdown"]
+        for r in baseline["results"]
+        if "slowdown" in r
+    }
+    failed = []
+    for r in report["results"]:
+        key = (r["workload"], r["backend"], r["scenario"])
+        if "slowdown" in r and key in old and r["slowdown"] > old[key] * max_regression:
+            failed.append(f"{'/'.join(key)}: x{old[key]} -> x{r['slowdown']}")
+    return failed
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--count-events":
+        count_events(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workloads", type=lambda s: s.split(","), default=list(WORKLOADS))
+    parser.add_argument("--backends", type=lambda s: s.split(","), default=BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--quick", action="store_true", help="small inputs, for smoke testing")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare slowdowns against")
+    parser.add_argument("--max-regression", type=float, default=1.25)
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        failed = regressions(report, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        for line in failed:
+            print(f"regression: {line}", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Measure how long NanoPDB takes to start, against bare Python.
+
+A short-lived command line tool (`benchmarks/workloads/cli.py`) is run under bare Python and under every
+NanoPDB version/backend that continues from the entrance break right away, once with a cold code cache
+(see `nanopdb.codecache`) and once with a warm one. Like `python -X importtime`, the time spent importing
+each debugger module is broken down, with the slowest modules it pulls in.
+The results are printed as JSON.
+
+usage:
+    python benchmarks/startup.py [--repeat N] [--backends v3,v4] [--top N] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+from bench import ROOT, WORKLOADS_DIR, _available, _time
+
+sys.path.insert(0, str(ROOT))
+from nanopdb.codecache import _cache_path  # noqa: E402
+
+BACKENDS = ["v0", "v1", "v2", "v3", "v4", "v5"]
+SCRIPT = WORKLOADS_DIR / "cli.py"
+ARGS = ["hello", "world", "--upper"]
+
+
+def import_times(module: str, env: dict) -> List[dict]:
+    """the `-X importtime` lines of importing `module`, as {"module", "self_us", "cumulative_us"}"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, cwd=ROOT, text=True, capture_output=True, check=True,
+    )
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if self_us.isdigit():
+            times.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return times
+
+
+def _clear_cache():
+    path = _cache_path(SCRIPT)
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def run(args) -> dict:
+    env = dict(os.environ, PYTHONPATH=str(ROOT) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    bare = _time([sys.executable, str(SCRIPT), *ARGS], "", env, args.repeat)
+    # the interpreter alone, the floor of any start
+    interpreter = _time([sys.executable, "-c", "pass"], "", env, args.repeat)
+    results = []
+    for backend in args.backends:
+        result = {"backend": backend}
+        if not _available(backend):
+            results.append(dict(result, skipped=True))
+            continue
+        backend_env = dict(env, NANOPDB_VERSION=backend[1:])
+        cmd = [sys.executable, "-m", "nanopdb", str(SCRIPT.relative_to(ROOT)), *ARGS]
+        stdin = "" if backend == "v0" else "cont()\n"
+        cold = float("inf")
+        for _ in range(args.repeat):
+            _clear_cache()
+            cold = min(cold, _time(cmd, stdin, backend_env, 1))
+        warm = _time(cmd, stdin, backend_env, args.repeat)
+        times = import_times(f"nanopdb.nanopdb_{backend}", backend_env)
+        slowest = sorted(times, key=lambda t: -t["self_us"])[: args.top]
+        results.append(
+            dict(
+                result,
+                cold_seconds=round(cold, 4),
+                warm_seconds=round(warm, 4),
+                overhead_seconds=round(warm - bare, 4),
+                import_seconds=round(times[-1]["cumulative_us"] / 1e6, 4) if times else None,
+                slowest_imports=slowest,
+            )
+        )
+        print(f"{backend} cold {cold:.3f}s warm {warm:.3f}s (bare {bare:.3f}s)", file=sys.stderr)
+    return {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "interpreter_seconds": round(interpreter, 4),
+        "bare_seconds": round(bare, 4),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", type=lambda s: s.split(","), default=BACKENDS)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to show")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import sys
+
+
+def never_called():
+    return 0  # bench: unhit
+
+
+def leaf(x: int) -> int:
+    return x + 1  # bench: hot x is None
+
+
+def middle(x: int) -> int:
+    return leaf(x) + leaf(-x)
+
+
+def calls(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += middle(i)
+    return total
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    print(calls(n))
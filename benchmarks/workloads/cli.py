@@ -0,0 +1,15 @@
+import argparse
+import sys
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="a short-lived command line tool")
+    parser.add_argument("words", nargs="*")
+    parser.add_argument("--upper", action="store_true")
+    args = parser.parse_args(argv)
+    text = " ".join(args.words)
+    return text.upper() if args.upper else text
+
+
+if __name__ == "__main__":
+    print(main(sys.argv[1:]))
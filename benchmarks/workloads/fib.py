@@ -0,0 +1,20 @@
+import sys
+
+
+def never_called():
+    return 0  # bench: unhit
+
+
+def fib(n: int) -> int:
+    if n <= 1:  # bench: hot n < 0
+        f = n
+    else:
+        f1 = fib(n - 1)
+        f2 = fib(n - 2)
+        f = f1 + f2
+    return f
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 33
+    print(fib(n))
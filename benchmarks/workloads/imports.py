@@ -0,0 +1,36 @@
+import sys
+
+NAMES = [
+    "argparse", "asyncio", "csv", "dataclasses", "decimal", "email.mime.multipart",
+    "fractions", "http.client", "json", "logging.handlers", "sqlite3", "statistics",
+    "tarfile", "unittest", "urllib.request", "uuid", "xml.dom.minidom", "zipfile",
+]
+
+
+def never_called():
+    return 0  # bench: unhit
+
+
+def import_all(names):
+    import importlib
+
+    modules = []
+    for name in names:
+        modules.append(importlib.import_module(name))  # bench: hot name is None
+    return len(modules)
+
+
+def import_rounds(rounds: int) -> int:
+    total = 0
+    for _ in range(rounds):
+        loaded = set(sys.modules)
+        total += import_all(NAMES)
+        # forget the modules of this round, the next one imports them again
+        for name in set(sys.modules) - loaded:
+            del sys.modules[name]
+    return total
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    print(import_rounds(rounds))
@@ -0,0 +1,17 @@
+import sys
+
+
+def never_called():
+    return 0  # bench: unhit
+
+
+def loop(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total += i * i % 7  # bench: hot i < 0
+    return total
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 12000000
+    print(loop(n))
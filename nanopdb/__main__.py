@@ -10,12 +10,32 @@ if NANOPDB_VERSION == '3':
     from nanopdb.nanopdb_v3 import NanoPDB
 if NANOPDB_VERSION == '4':
     from nanopdb.nanopdb_v4 import NanoPDB
+if NANOPDB_VERSION == '5':
+    from nanopdb.nanopdb_v5 import NanoPDB
+import signal
 import sys
+import types
 
 _usage = """\
 Debug the Python program given by pyfile.
 usage:
-    python -m nanopdb [-h] pyfile [arg] ...
+    python -m nanopdb [-h] [--lazy [--signal SIGNAL]] [--record | --record-locals]
+                      [--profile [--profile-output FILE]] [--post-mortem]
+                      [--stats FILE] [--untraced-children] [--remote ADDRESS]
+                      [--commands FILE] pyfile [arg] ...
+options:
+    --lazy           run at full speed without a tracer until SIGNAL arrives, then stop at the next line
+    --signal SIGNAL  the signal that attaches the debugger in --lazy mode (default: SIGUSR1)
+    --record         record the last events in a ring buffer, browse them with history(), back() and forward()
+    --record-locals  like --record, and also keep the scalar locals of every line for where_was(var)
+    --profile        sample the stacks of all threads instead of tracing, show the busiest functions at exit
+    --profile-output FILE  also write the sampled stacks in folded format (flamegraph.pl, speedscope) to FILE
+    --stats FILE     count the events and time spent in the debugger, written to FILE as JSON at exit
+    --post-mortem    run at full speed without a tracer, open the console on the traceback of an uncaught exception
+    --untraced-children  run child processes that have no breakpoint at full speed without a tracer
+    --remote ADDRESS serve the console to `python -m nanopdb.client ADDRESS` (host:port or a Unix socket path)
+    --commands FILE  no console: set the breakpoints of the JSON session FILE, run its actions at every stop,
+                     and write the results as JSON lines
 """
 
 if __name__ == "__main__":
@@ -23,11 +43,47 @@ if __name__ == "__main__":
         print(_usage)
         sys.exit(0)
 
+    _run_options = {}
+    while len(sys.argv) > 1 and sys.argv[1].startswith("--"):
+        _option = sys.argv.pop(1)
+        if _option == "--lazy":
+            _run_options["lazy"] = True
+        elif _option == "--signal" and len(sys.argv) > 1:
+            _name = sys.argv.pop(1).upper()
+            _run_options["attach_signal"] = getattr(signal, _name if _name.startswith("SIG") else "SIG" + _name)
+        elif _option == "--record":
+            _run_options["record"] = True
+        elif _option == "--record-locals":
+            _run_options["record_locals"] = True
+        elif _option == "--stats" and len(sys.argv) > 1:
+            _run_options["stats"] = sys.argv.pop(1)
+        elif _option == "--post-mortem":
+            _run_options["post_mortem"] = True
+        elif _option == "--remote" and len(sys.argv) > 1:
+            _run_options["remote"] = sys.argv.pop(1)
+        elif _option == "--commands" and len(sys.argv) > 1:
+            _run_options["commands"] = sys.argv.pop(1)
+        elif _option == "--untraced-children":
+            _run_options["untraced_children"] = True
+        elif _option == "--profile":
+            _run_options["profile"] = True
+        elif _option == "--profile-output" and len(sys.argv) > 1:
+            _run_options["profile_output"] = sys.argv.pop(1)
+        else:
+            print(_usage)
+            sys.exit(2)
+    if _run_options and NANOPDB_VERSION != '3':
+        print("--lazy, --record, --profile, --post-mortem, --stats, --untraced-children, --remote and --commands are only supported by the settrace debugger, NANOPDB_VERSION=3")
+        sys.exit(2)
+
     dbg = NanoPDB()
     try:
         sys.argv.pop(0)
-        dbg.run(
-            globals().copy()
-        )  # we need to copy the global namespace in the file `__main__.py`, coz we need to inherit the key like "__name__"
+        # run the script as a fresh `__main__` module, like pdb does, so that pickle and multiprocessing find
+        # the functions it defines, and spawned children run it again as `__mp_main__`
+        _main = types.ModuleType("__main__")
+        _main.__file__ = os.path.abspath(sys.argv[0])
+        sys.modules["__main__"] = _main
+        dbg.run(_main.__dict__, **_run_options)
     except KeyboardInterrupt:
         pass
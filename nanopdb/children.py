@@ -0,0 +1,136 @@
+import os
+import sys
+import types
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # no fork, and spawned children cannot share the console safely
+    fcntl = None
+
+# key of the debugger in the preparation data that multiprocessing sends to spawned children
+PREPARATION_KEY = "nanopdb"
+
+
+def _is_devnull(stream) -> bool:
+    # multiprocessing reopens stdin of its children on /dev/null, as a file descriptor
+    try:
+        return os.path.samestat(os.fstat(stream.fileno()), os.stat(os.devnull))
+    except (OSError, ValueError):
+        return False
+
+
+class ProcessConsole:
+    """
+    the terminal shared by a tree of debugged processes: a process holds it while stopped, and the others
+    wait for it, with an flock on `lock_path`. Children started by multiprocessing have /dev/null as stdin,
+    their console reads the controlling terminal instead.
+    """
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._terminal = None
+
+    def after_fork(self):
+        # an flock belongs to the open file, which a forked child shares with its parent until it opens its own
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _stdin(self):
+        stdin = sys.stdin
+        if stdin is not None and not stdin.closed and not _is_devnull(stdin):
+            return stdin
+        if self._terminal is None:
+            try:
+                self._terminal = open("/dev/tty")
+            except OSError:
+                print(f"No terminal for the console of process {os.getpid()}, it continues")
+                return stdin
+        return self._terminal
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_path, "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        stdin = sys.stdin
+        try:
+            sys.stdin = self._stdin()
+            yield
+        finally:
+            sys.stdin = stdin
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+
+class SpawnBootstrap:
+    """
+    sent to spawned children in the preparation data, unpickling it there starts a debugger with `table`,
+    see `NanoPDB._breakpoint_table`
+    """
+
+    def __init__(self, table: dict):
+        self.table = table
+
+    def __reduce__(self):
+        # the preparation data is unpickled before `multiprocessing.spawn.prepare` sets up sys.path, which
+        # then replaces this one
+        source = (
+            f"import sys\nsys.path.insert(0, {os.path.dirname(os.path.dirname(__file__))!r})\n"
+            "from nanopdb.children import start_spawned_child\nstart_spawned_child(table)\n"
+        )
+        return (exec, (source, {"table": self.table}))
+
+
+def patch_spawn(spawn: types.ModuleType, table: Callable[[], dict]):
+    """make `multiprocessing.spawn` send a `SpawnBootstrap` with the current `table()` to every child"""
+    get_preparation_data = spawn.get_preparation_data
+
+    def get_preparation_data_with_debugger(name: str) -> dict:
+        data = get_preparation_data(name)
+        data[PREPARATION_KEY] = SpawnBootstrap(table())
+        return data
+
+    spawn.get_preparation_data = get_preparation_data_with_debugger
+
+
+def _finalize_at_exit(log_buffer):
+    sys.modules["multiprocessing.util"].Finalize(None, log_buffer.flush, exitpriority=0)
+
+
+def flush_at_child_exit(log_buffer):
+    """
+    flush `log_buffer` when this forked child exits. Children of multiprocessing leave with os._exit, which
+    skips atexit, but run the finalizers they registered after dropping those of their parent
+    """
+    util = sys.modules.get("multiprocessing.util")
+    if util is not None:
+        util.register_after_fork(log_buffer, _finalize_at_exit)
+
+
+def start_spawned_child(table: dict):
+    from importlib import import_module
+
+    debugger = import_module(table["debugger"]).NanoPDB()
+    spawn = sys.modules["multiprocessing.spawn"]
+    prepare = spawn.prepare
+
+    def prepare_and_notify(data: dict):
+        # `prepare` runs the main script as `__mp_main__`, which does not go through the import hook
+        prepare(data)
+        debugger._child_main_loaded()
+
+    spawn.prepare = prepare_and_notify
+    debugger.start_child(table)
+
+
+def console_lock_path() -> str:
+    import tempfile
+
+    return os.path.join(tempfile.gettempdir(), f"nanopdb-{os.getpid()}.lock")
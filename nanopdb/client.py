@@ -0,0 +1,167 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from nanopdb.remote import decode, encode, parse_address
+
+_usage = """\
+Serve the consoles of the debuggees started with `python -m nanopdb --remote ADDRESS`.
+usage:
+    python -m nanopdb.client [-h] ADDRESS
+ADDRESS is host:port, or the path of a Unix socket. Every process connects on its first stop, the input
+goes to the stopped process named in the prompt, and these lines are for the client itself:
+    %list         show the connected processes, and where they are stopped
+    %switch PID   send the input to another stopped process
+"""
+
+
+class Session:
+    """the connection of one debuggee process"""
+
+    def __init__(self, pid: int, writer: asyncio.StreamWriter):
+        self.pid = pid
+        self.writer = writer
+        # the stop message while the process is stopped
+        self.stop: Optional[dict] = None
+        # replies to the input sent, None once the process is gone
+        self.replies: asyncio.Queue = asyncio.Queue()
+
+
+class Hub:
+    """multiplexes the debuggee processes connected to the client, and their stops, on one terminal"""
+
+    def __init__(self):
+        self.sessions: Dict[int, Session] = {}
+        # stopped sessions, in the order they stopped, the input goes to the first one
+        self.stopped: Deque[Session] = deque()
+        self._stopped_changed = asyncio.Event()
+        self._next_id = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = None
+        try:
+            while line := await reader.readline():
+                message = decode(line)
+                event = message["event"]
+                if event == "hello":
+                    session = self.sessions[message["pid"]] = Session(message["pid"], writer)
+                    print(f"\n[{session.pid}] connected: {' '.join(message['argv'])}")
+                elif event == "stop":
+                    session.stop = message
+                    self.stopped.append(session)
+                    print(f"\n[{session.pid}] {message['message']}")
+                    self._stopped_changed.set()
+                elif event == "reply":
+                    if message.get("running"):
+                        # handled here, in order with the next stop of the process
+                        session.stop = None
+                        self.stopped.remove(session)
+                    session.replies.put_nowait(message)
+        finally:
+            writer.close()
+            if session is not None:
+                print(f"\n[{session.pid}] disconnected")
+                self.sessions.pop(session.pid, None)
+                if session in self.stopped:
+                    self.stopped.remove(session)
+                    self._stopped_changed.set()
+                session.replies.put_nowait(None)
+
+    def _command(self, line: str):
+        name, _, argument = line[1:].partition(" ")
+        if name == "list":
+            for session in self.sessions.values():
+                where = session.stop["message"] if session.stop else "running"
+                print(f"{'*' if self.stopped and session is self.stopped[0] else ' '} [{session.pid}] {where}")
+        elif name == "switch" and argument.strip().isdigit():
+            session = self.sessions.get(int(argument))
+            if session is None or session not in self.stopped:
+                print(f"Process {argument.strip()} is not stopped")
+                return
+            self.stopped.remove(session)
+            self.stopped.appendleft(session)
+            print(f"[{session.pid}] {session.stop['message']}")
+        else:
+            print(_usage)
+
+    async def repl(self):
+        loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue()
+
+        def read_stdin():
+            # a daemon thread, blocking reads must not keep the client alive after Ctrl-C
+            while True:
+                line = sys.stdin.readline()
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+                if not line:
+                    return
+
+        threading.Thread(target=read_stdin, daemon=True).start()
+        more = False
+        line_read = asyncio.ensure_future(lines.get())
+        while True:
+            session = self.stopped[0] if self.stopped else None
+            if session is not None:
+                sys.stdout.write(f"[{session.pid}] {'...' if more else '>>>'} ")
+                sys.stdout.flush()
+            # a stop shows the prompt again, the %commands work while every process runs
+            self._stopped_changed.clear()
+            stopped_changed = asyncio.ensure_future(self._stopped_changed.wait())
+            await asyncio.wait({line_read, stopped_changed}, return_when=asyncio.FIRST_COMPLETED)
+            stopped_changed.cancel()
+            if not line_read.done():
+                continue
+            line = line_read.result()
+            if not line:
+                return
+            line_read = asyncio.ensure_future(lines.get())
+            line = line.rstrip("\n")
+            if line.startswith("%"):
+                self._command(line)
+                continue
+            if session is None or session.pid not in self.sessions:
+                # it disconnected while the prompt was shown
+                more = False
+                continue
+            self._next_id += 1
+            session.writer.write(encode({"id": self._next_id, "op": "push", "line": line}))
+            await session.writer.drain()
+            reply = await session.replies.get()
+            if reply is None:
+                more = False
+                continue
+            sys.stdout.write(reply["output"])
+            more = reply.get("more", False)
+            if reply.get("running"):
+                more = False
+                if self.stopped:
+                    print(f"[{self.stopped[0].pid}] {self.stopped[0].stop['message']}")
+
+async def serve(address: str):
+    hub = Hub()
+    family, bind = parse_address(address)
+    if family == socket.AF_UNIX:
+        server = await asyncio.start_unix_server(hub.handle, bind)
+    else:
+        server = await asyncio.start_server(hub.handle, *bind)
+    print(f"Waiting for debuggees at {address}")
+    try:
+        async with server:
+            await hub.repl()
+    finally:
+        if family == socket.AF_UNIX and os.path.exists(bind):
+            os.remove(bind)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] == "-h":
+        print(_usage)
+        sys.exit(0 if sys.argv[1:] == ["-h"] else 2)
+    try:
+        asyncio.run(serve(sys.argv[1]))
+    except KeyboardInterrupt:
+        pass
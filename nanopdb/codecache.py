@@ -0,0 +1,57 @@
+import marshal
+import os
+import sys
+import types
+from importlib.util import MAGIC_NUMBER, cache_from_source, source_hash
+from typing import Optional, Union
+
+# the code of a script compiled by the debugger, next to the pyc files of the interpreter:
+# __pycache__/<script>.<cache tag>.nanopdb, holding MAGIC_NUMBER, the source hash, then the marshalled code
+_SUFFIX = ".nanopdb"
+
+
+def _cache_path(file: Union[str, os.PathLike]) -> Optional[str]:
+    try:
+        return os.path.splitext(cache_from_source(os.path.abspath(file)))[0] + _SUFFIX
+    except NotImplementedError:
+        # no cache tag, e.g. sys.implementation.cache_tag is None
+        return None
+
+
+def compile_script(
+    file: Union[str, os.PathLike], source: Union[str, bytes, None] = None
+) -> types.CodeType:
+    """
+    compile the script `file` (or its `source` when already read) under its base name, like
+    `compile(source, Path(file).name, "exec")`, reusing the code compiled by an earlier run as long as the
+    source hash is the same, like hash based pyc files
+    """
+    name = os.path.basename(file)
+    if source is None:
+        with open(file, "rb") as f:
+            source = f.read()
+    key = source_hash(source.encode() if isinstance(source, str) else source)
+    path = _cache_path(file)
+    if path is not None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if data[:4] == MAGIC_NUMBER and data[4:12] == key:
+                code = marshal.loads(data[12:])
+                # the code is compiled under the name given on the command line
+                if isinstance(code, types.CodeType) and code.co_filename == name:
+                    return code
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+    code = compile(source, name, "exec", dont_inherit=True)
+    if path is not None and not sys.dont_write_bytecode:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written aside and renamed, so that concurrent runs never read a partial file
+            partial = f"{path}.{os.getpid()}"
+            with open(partial, "wb") as f:
+                f.write(MAGIC_NUMBER + key + marshal.dumps(code))
+            os.replace(partial, path)
+        except OSError:
+            pass
+    return code
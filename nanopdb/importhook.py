@@ -0,0 +1,73 @@
+import sys
+import types
+from importlib.machinery import ModuleSpec, SourceFileLoader, SourcelessFileLoader
+from typing import Callable, Dict, Optional, Set
+
+# loaders that load one file each, and compile it in `get_code`
+_FILE_LOADERS = (SourceFileLoader, SourcelessFileLoader)
+
+
+class BreakpointFinder:
+    """
+    first finder on sys.meta_path, it shows the debugger the code of modules with breakpoints before they run.
+    `files` maps canonical file names to their breakpoint lines, `resolve(file, code)` gets the module's code
+    and returns the code to run instead. Imports are only looked at while there are breakpoints or watched
+    modules, and the spec of the other finders is returned as is, so that the import system does not search again.
+    """
+
+    def __init__(
+        self,
+        files: Dict[str, Set[int]],
+        canonic: Callable[[str], str],
+        resolve: Callable[[str, types.CodeType], types.CodeType],
+    ):
+        self._files = files
+        self._canonic = canonic
+        self._resolve = resolve
+        # module name -> called with the module once it is imported
+        self._watched: Dict[str, Callable[[types.ModuleType], None]] = {}
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def watch(self, name: str, callback: Callable[[types.ModuleType], None]):
+        """call `callback` with the module `name` once it is imported, right away if it already is"""
+        module = sys.modules.get(name)
+        if module is not None:
+            callback(module)
+        else:
+            self._watched[name] = callback
+
+    def find_spec(self, fullname: str, path=None, target=None) -> Optional[ModuleSpec]:
+        if not self._files and not self._watched:
+            return None
+        spec = None
+        for finder in sys.meta_path:
+            if finder is not self and hasattr(finder, "find_spec"):
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+        if spec is None or not spec.origin or not isinstance(spec.loader, _FILE_LOADERS):
+            return spec
+        callback = self._watched.pop(fullname, None)
+        if callback is not None:
+            exec_module = spec.loader.exec_module
+
+            def exec_module_and_call_back(module: types.ModuleType):
+                exec_module(module)
+                callback(module)
+
+            spec.loader.exec_module = exec_module_and_call_back
+        file = self._canonic(spec.origin)
+        if self._files.get(file):
+            # file loaders are made per module, so the patched `get_code` only ever loads this file
+            loader = spec.loader
+            get_code = loader.get_code
+
+            def get_code_with_breakpoints(name: str) -> Optional[types.CodeType]:
+                code = get_code(name)
+                return code if code is None else self._resolve(file, code)
+
+            loader.get_code = get_code_with_breakpoints
+        return spec
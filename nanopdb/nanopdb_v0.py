@@ -2,7 +2,6 @@ import sys
 from pathlib import Path
 from typing import Callable, Optional, List
 from dataclasses import dataclass
-from icecream import ic
 from code import InteractiveConsole
 
 @dataclass
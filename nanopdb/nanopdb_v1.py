@@ -2,12 +2,8 @@ import sys
 from pathlib import Path
 from typing import Callable, Optional, List, Dict, Set, Tuple
 from dataclasses import dataclass
-from icecream import ic
 from code import InteractiveConsole
 import types
-import inspect
-import re
-import tokenize
 
 
 @dataclass
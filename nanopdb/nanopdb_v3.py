@@ -1,12 +1,84 @@
+import atexit
+import io
+import os
+import signal
+import site
 import sys
-from pathlib import Path
-from typing import Callable, Optional, List, Dict, Set, Tuple
+import sysconfig
+import threading
+from collections import deque
+from contextlib import nullcontext, redirect_stdout
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, List, Dict, Set, Tuple, Union
+from collections.abc import MutableMapping
 from dataclasses import dataclass
-from icecream import ic
+from fnmatch import fnmatchcase
+from opcode import opmap
 from code import InteractiveConsole
 import types
 from enum import Enum
 
+from nanopdb.children import ProcessConsole, console_lock_path, flush_at_child_exit, patch_spawn
+from nanopdb.codecache import compile_script
+from nanopdb.importhook import BreakpointFinder
+from nanopdb.recorder import EVENT_CODES, EventRecorder
+from nanopdb.values import display, short_repr, show
+
+if TYPE_CHECKING:
+    # imported where the option that needs them is turned on, they are not on the way of a plain start
+    from nanopdb.profiler import SamplingProfiler
+    from nanopdb.remote import RemoteConsole
+    from nanopdb.session import CommandSession
+    from nanopdb.stats import TracerStats
+
+
+# code flags of coroutines, generator based coroutines and async generators, see `inspect.CO_COROUTINE`
+CO_ASYNC = 0x80 | 0x100 | 0x200
+_YIELD_VALUE = opmap["YIELD_VALUE"]
+# the instructions a frame returns a value with, RETURN_CONST is new in Python 3.12
+_RETURNS = {opmap[name] for name in ("RETURN_VALUE", "RETURN_CONST") if name in opmap}
+# the first instruction of every `except`, `finally` and `with` handler
+_PUSH_EXC_INFO = opmap["PUSH_EXC_INFO"]
+# from Python 3.13, the `f_lasti` of a suspended frame is the instruction after its yield
+_YIELD_LASTI_OFFSET = 2 if sys.version_info >= (3, 13) else 0
+
+
+def _default_exclude() -> List[str]:
+    # the standard library, frozen stdlib modules and installed packages, and the event loops by module name
+    paths = {sysconfig.get_paths()[name] for name in ("stdlib", "platstdlib", "purelib", "platlib")}
+    paths.update(site.getsitepackages() if hasattr(site, "getsitepackages") else [])
+    if site.ENABLE_USER_SITE:
+        paths.add(site.getusersitepackages())
+    return sorted(os.path.join(os.path.realpath(path), "*") for path in paths) + [
+        "<frozen *>",
+        "asyncio.*",
+        "uvloop.*",
+    ]
+
+
+def _walk_codes(code: types.CodeType) -> Iterator[types.CodeType]:
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _walk_codes(const)
+
+
+def _lines_with_code(codes: List[types.CodeType]) -> Set[int]:
+    return {line for code in codes for _, _, line in code.co_lines() if line is not None}
+
+
+def _current_task():
+    # only programs that imported asyncio can be running a task, do not import it for the others
+    current_task = getattr(sys.modules.get("asyncio"), "current_task", None)
+    if current_task is None:
+        # not imported, or still being imported
+        return None
+    try:
+        return current_task()
+    except RuntimeError:
+        # no event loop running in this thread
+        return None
+
 
 @dataclass
 class NanoPDBContinue:
@@ -19,33 +91,321 @@ class StepMode(Enum):
     out = 2
 
 
+# looked up on every call while stepping, a module global is faster than the Enum class attribute
+_STEP_INTO = StepMode.into
+
+
+@dataclass
+class BreakpointCondition:
+    source: str
+    code: types.CodeType
+    # number of times evaluating the condition raised
+    errors: int = 0
+
+
+class LogBuffer:
+    """
+    ring buffer of logpoint messages, keeping the last `capacity` of them in memory.
+    Messages are written to `sink` ("stderr", a file path to append to, or a function taking a list of
+    messages) in batches of `batch`, a sink of None keeps them in memory only.
+    """
+
+    def __init__(
+        self, capacity: int = 10000, batch: int = 1000, sink: Union[str, Callable, None] = "stderr"
+    ):
+        self.batch = batch
+        self.sink = sink
+        # messages lost because they were overwritten before being flushed
+        self.dropped = 0
+        self._messages: deque = deque(maxlen=capacity)
+        self._unflushed = 0
+
+    def append(self, message: str):
+        if self._unflushed == self._messages.maxlen:
+            self.dropped += 1
+        else:
+            self._unflushed += 1
+        self._messages.append(message)
+        if self.sink and self._unflushed >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if not self.sink or not self._unflushed:
+            return
+        start = len(self._messages) - self._unflushed
+        if callable(self.sink):
+            self.sink(list(islice(self._messages, start, None)))
+            self._unflushed = 0
+            return
+        text = "\n".join(islice(self._messages, start, None)) + "\n"
+        if self.sink == "stderr":
+            sys.stderr.write(text)
+            sys.stderr.flush()
+        else:
+            with open(self.sink, "a") as f:
+                f.write(text)
+        self._unflushed = 0
+
+    def tail(self, n: int) -> List[str]:
+        return list(islice(self._messages, max(len(self._messages) - n, 0), None))
+
+
 @dataclass
 class StepState:
     mode: StepMode
     frame: types.FrameType
 
 
+def _write_back_locals(frame: types.FrameType):
+    # before PEP 667 (Python 3.13) `frame.f_locals` is a snapshot, copy it back into the fast locals
+    if sys.version_info < (3, 13):
+        import ctypes
+
+        ctypes.pythonapi.PyFrame_LocalsToFast(ctypes.py_object(frame), ctypes.c_int(1))
+
+
+class FrameNamespace(MutableMapping):
+    """
+    local namespace of the console at a stop, looked up on access instead of copied: the helpers,
+    then the names assigned in the console, then the locals of the frame. The globals of the frame
+    are used as they are, see `FrameConsole`. Assigning or deleting a local of the frame changes the frame.
+    """
+
+    def __init__(self, frame: types.FrameType, helpers: dict):
+        self._helpers = helpers
+        # names that only exist in the console
+        self._names: dict = {}
+        self.select(frame)
+
+    def select(self, frame: types.FrameType):
+        """look up locals in another frame, e.g. a caller"""
+        self.frame = frame
+        self._locals = frame.f_locals
+        code = frame.f_code
+        self._frame_names = set(code.co_varnames + code.co_cellvars + code.co_freevars)
+        # module level code has its globals as locals, where any new name is a local too
+        self._module_level = self._locals is frame.f_globals
+
+    def _is_frame_local(self, name: str) -> bool:
+        return self._module_level or name in self._frame_names or name in self._locals
+
+    def __getitem__(self, name: str):
+        for layer in (self._helpers, self._names, self._locals):
+            if name in layer:
+                return layer[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value):
+        if self._is_frame_local(name):
+            self._locals[name] = value
+            _write_back_locals(self.frame)
+        else:
+            self._names[name] = value
+
+    def __delitem__(self, name: str):
+        if name in self._names:
+            del self._names[name]
+        elif name in self._locals:
+            del self._locals[name]
+            _write_back_locals(self.frame)
+        else:
+            raise KeyError(name)
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for layer in (self._helpers, self._names, self._locals):
+            for name in layer:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class FrameConsole(InteractiveConsole):
+    """
+    an InteractiveConsole running code in the globals of the selected frame and a FrameNamespace,
+    InteractiveConsole runs code with its locals as globals
+    """
+
+    def __init__(self, namespace: FrameNamespace):
+        super().__init__(locals=namespace)
+
+    @property
+    def globals(self) -> dict:
+        return self.locals.frame.f_globals
+
+    def runcode(self, code: types.CodeType):
+        try:
+            if any(isinstance(c, types.CodeType) for c in code.co_consts):
+                self._run_nested(code)
+            else:
+                exec(code, self.globals, self.locals)
+        except SystemExit:
+            raise
+        except:
+            self.showtraceback()
+
+    def _run_nested(self, code: types.CodeType):
+        # functions, lambdas and comprehensions only look up globals, so for the input that defines one
+        # merge the locals into a copy of the globals, and assign the names it stored afterwards
+        namespace = dict(self.globals)
+        namespace.update(self.locals)
+        missing = object()
+        before = {name: namespace.get(name, missing) for name in code.co_names}
+        try:
+            exec(code, namespace)
+        finally:
+            for name, value in before.items():
+                after = namespace.get(name, missing)
+                if after is not missing and after is not value:
+                    self.locals[name] = after
+
+
+class ThreadState(threading.local):
+    """the part of the debugger state that every thread has its own copy of"""
+
+    def __init__(self):
+        self.in_breakpoint = False
+        self.single_step: Optional[StepState] = None
+        # number of traced frames on the stack, for the depth of recorded events
+        self.record_depth = 0
+        # frame -> exception that went through it, until the frame handles it or returns
+        self.unwinding: Dict[types.FrameType, BaseException] = {}
+
+
 # NanoPDB V3: single step. including 1. step over code, 2. step over lines, 3. into function calls, and 4. out of function
 class NanoPDB:
     def __init__(self):
-        self._main_file: Optional[Path] = None
-        self._in_breakpoint = False
+        self._main_file: Optional[str] = None
+        self._main_path: Optional[str] = None
         self._is_first_call = True
+        # `_in_breakpoint` and `_single_step` are per thread, see the properties below
+        self._thread_state = ThreadState()
+        # idents of the threads with a `_single_step`, so that the hot path can skip the lookup above
+        self._stepping_threads: Set[int] = set()
+        # only one thread stops at a time, threads that never stop never take this lock
+        self._stop_lock = threading.Lock()
+        # "run": other threads keep running while one is stopped, "park": they wait at their next line
+        self.thread_policy = "run"
+        self._parked_by: Optional[int] = None
+        self._resume = threading.Event()
+        # --lazy: no tracer until the attach signal arrives, see `_on_attach_signal`
+        self._lazy = False
+        self._attach_pending = False
+        # --record: every traced event goes into this ring buffer, see `_record`
+        self._recorder: Optional[EventRecorder] = None
+        # --stats or `stats()`: counts and times the debugger's own work, see `enable_stats`
+        self._stats: Optional["TracerStats"] = None
+        # --post-mortem: no tracer, stop on the traceback of uncaught exceptions, see `_post_mortem`
+        self._post_mortem_enabled = False
+        # --profile or `profile_here()`: samples stacks instead of tracing
+        self._profiler: Optional["SamplingProfiler"] = None
+        # child processes: forked ones keep this debugger, see `_after_fork_in_child`, spawned ones get a copy
+        # of its breakpoints, see `start_child`. All of them share the console of the first process
+        self._root_pid = os.getpid()
+        self._process_console: Optional[ProcessConsole] = None
+        # --untraced-children: children without any breakpoint run without tracer
+        self._untraced_children = False
+        # --remote: the console is served to `python -m nanopdb.client` instead of stdin
+        self._remote: Optional["RemoteConsole"] = None
+        # --commands: the stops run the actions of a session file and write JSON lines, see `CommandSession`
+        self._session: Optional["CommandSession"] = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self._share_console, after_in_child=self._after_fork_in_child)
+
+        # canonical file name -> {line numbers of breakpoints}, see `_canonic`
+        self._breakpoints_in_files: Dict[str, Set[int]] = {}
+        self._breakpoint_conditions: Dict[Tuple[str, int], BreakpointCondition] = {}
+        # (file, line) -> times the line was reached, and hits left to ignore before stopping
+        self._breakpoint_hits: Dict[Tuple[str, int], int] = {}
+        self._breakpoint_ignores: Dict[Tuple[str, int], int] = {}
+        # (file, line) of breakpoints removed on their first stop
+        self._temporary_breakpoints: Set[Tuple[str, int]] = set()
+        # (file, line) -> compiled f-string of logpoints, which log it instead of stopping
+        self._logpoints: Dict[Tuple[str, int], BreakpointCondition] = {}
+        # (file, line) -> asyncio.Task, or task name, the breakpoint is scoped to
+        self._breakpoint_tasks: Dict[Tuple[str, int], object] = {}
+        self._log_buffer = LogBuffer()
+        atexit.register(self._log_buffer.flush)
+        # code object -> canonical name of its co_filename
+        self._code_files: Dict[types.CodeType, str] = {}
+        # code object -> (first line, last line) it covers, see `_code_line_range`
+        self._code_line_ranges: Dict[types.CodeType, Tuple[int, int]] = {}
+        # code object -> whether a breakpoint falls inside it, reset whenever breakpoints change
+        self._code_has_breakpoint: Dict[types.CodeType, bool] = {}
+        # canonical file -> its lines with code, and the code objects of its module, known from when the
+        # import hook saw the module before it ran, see `_resolve_module`
+        self._file_lines: Dict[str, Set[int]] = {}
+        self._file_codes: Dict[str, List[types.CodeType]] = {}
+        self._import_hook = BreakpointFinder(
+            self._breakpoints_in_files, self._canonic, self._resolve_module
+        )
+        # code object -> whether it belongs to the debugger itself
+        self._debugger_codes: Dict[types.CodeType, bool] = {}
+        # glob patterns on file paths and module names, frames that match `_exclude` and not `_include`
+        # are not stepped into nor recorded, see `_is_filtered`
+        self._include: List[str] = []
+        self._exclude: List[str] = _default_exclude()
+        self._code_filtered: Dict[types.CodeType, bool] = {}
 
-        # file -> {line numbers of breakpoints}
-        self._breakpoints_in_files: Dict[Path, Set[int]] = {}
-        self._breakpoint_conditions: Dict[Tuple[Path, int], str] = {}
+        # breakpoints served from call, exception and return events, see `_dispatch_events`:
+        # function name -> condition, stop when a function of that (qualified) name is called
+        self._function_breakpoints: Dict[str, Optional[BreakpointCondition]] = {}
+        # exception class name -> "raised", "caught" or "uncaught"
+        self._exception_breakpoints: Dict[str, str] = {}
+        # function name -> condition on `retval`, stop when a function of that name returns
+        self._return_breakpoints: Dict[str, Optional[BreakpointCondition]] = {}
+        # code object -> (its name in `_function_breakpoints`, its name in `_return_breakpoints`)
+        self._code_event_names: Dict[types.CodeType, Tuple[Optional[str], Optional[str]]] = {}
+        self._has_event_breakpoints = False
+        self._previous_thread_excepthook = threading.excepthook
 
-        self._single_step: Optional[StepState] = None
         """ if true, step into functions when single stepping """
         self._single_step_instead_of_continue = False
         self._single_step_instead_of_continue_into = False
         self._single_step_instead_of_continue_out = False
 
-    def _eval(self, _locals: dict, message: str):
+    @property
+    def _in_breakpoint(self) -> bool:
+        return self._thread_state.in_breakpoint
+
+    @_in_breakpoint.setter
+    def _in_breakpoint(self, value: bool):
+        self._thread_state.in_breakpoint = value
+
+    @property
+    def _single_step(self) -> Optional[StepState]:
+        return self._thread_state.single_step
+
+    @_single_step.setter
+    def _single_step(self, value: Optional[StepState]):
+        self._thread_state.single_step = value
+        if value is None:
+            self._stepping_threads.discard(threading.get_ident())
+        else:
+            self._stepping_threads.add(threading.get_ident())
+
+    def _eval(self, _locals: MutableMapping, message: str):
         try:
-            print(message)
-            InteractiveConsole(locals=_locals).interact(banner="", exitmsg="")
+            if isinstance(_locals, FrameNamespace):
+                console = FrameConsole(_locals)
+            else:
+                console = InteractiveConsole(locals=_locals)
+            if self._session is not None:
+                self._session.interact(console, message)
+            elif self._remote is not None:
+                self._remote.interact(console, message)
+            else:
+                print(message)
+                # echoed values are cut, a 10M element list must not freeze the stop, see `show` for all of it
+                displayhook = sys.displayhook
+                sys.displayhook = display
+                try:
+                    console.interact(banner="", exitmsg="")
+                finally:
+                    sys.displayhook = displayhook
         except SystemExit as e:
             if isinstance(e.args[0], NanoPDBContinue):
                 if e.args[0].exit:
@@ -53,58 +413,598 @@ class NanoPDB:
             else:
                 exit(e.args)
 
-    def add_breakpoint(self, file: str, line: int, condition: Optional[str]):
-        p = Path(file)
+    def _compile_condition(
+        self, file: str, line: int, condition: str, what: str = "condition"
+    ) -> Optional[BreakpointCondition]:
+        # compile once here, so that hitting the breakpoint only has to evaluate it
+        expression = condition if what == "condition" else f"f{condition!r}"
+        try:
+            code = compile(expression, f"<{what} {file}:{line}>", "eval")
+        except SyntaxError as e:
+            print(f"Invalid {what} for breakpoint {file}:{line}: {e.msg}")
+            return None
+        return BreakpointCondition(condition, code)
+
+    def add_breakpoint(
+        self,
+        file: str,
+        line: int,
+        condition: Optional[str] = None,
+        ignore: int = 0,
+        temporary: bool = False,
+        log: Optional[str] = None,
+        task=None,
+    ):
+        """task (default:None) an asyncio.Task, or the name of one, to only stop in that task"""
+        compiled_condition = None
+        if condition:
+            compiled_condition = self._compile_condition(file, line, condition)
+            if compiled_condition is None:
+                return
+        compiled_log = None
+        if log:
+            compiled_log = self._compile_condition(file, line, log, what="log message")
+            if compiled_log is None:
+                return
+        p = self._canonic(file)
         if p not in self._breakpoints_in_files:
             self._breakpoints_in_files[p] = set()
         if line in self._breakpoints_in_files[p]:
             print(f"Breakpoint {file}:{line} already set")
             if condition:
-                self._breakpoint_conditions[(p, line)] = condition
+                self._breakpoint_conditions[(p, line)] = compiled_condition
                 print("Condition updated")
+            if ignore:
+                self._breakpoint_ignores[(p, line)] = ignore
+                print(f"Will ignore next {ignore} hits")
+            if temporary:
+                self._temporary_breakpoints.add((p, line))
+            if log:
+                self._logpoints[(p, line)] = compiled_log
+                print("Log message updated")
+            if task is not None:
+                self._breakpoint_tasks[(p, line)] = task
+                print(f"Only stops in task {self._task_name(task)}")
             return
         self._breakpoints_in_files[p].add(line)
+        self._code_has_breakpoint.clear()
+        self._trace_frames_with_breakpoint()
         if condition:
-            self._breakpoint_conditions[(p, line)] = condition
+            self._breakpoint_conditions[(p, line)] = compiled_condition
+        self._breakpoint_hits[(p, line)] = 0
+        if ignore:
+            self._breakpoint_ignores[(p, line)] = ignore
+        if temporary:
+            self._temporary_breakpoints.add((p, line))
+        if log:
+            self._logpoints[(p, line)] = compiled_log
+        if task is not None:
+            self._breakpoint_tasks[(p, line)] = task
+        kind = "Temporary breakpoint" if temporary else "Breakpoint"
+        if log:
+            kind = f"Logpoint {log!r}"
+        scope = f" in task {self._task_name(task)}" if task is not None else ""
         if condition:
-            print(f"Breakpoint at {file}:{line} if {condition}")
+            print(f"{kind} at {file}:{line}{scope} if {condition}")
         else:
-            print(f"Breakpoint at {file}:{line}")
+            print(f"{kind} at {file}:{line}{scope}")
+        self._check_breakpoint_line(p, line)
 
     def remove_breakpoint(self, file: str, line: int):
-        p = Path(file)
-        if p in self._breakpoints_in_files:
+        p = self._canonic(file)
+        if line in self._breakpoints_in_files.get(p, ()):
             self._breakpoints_in_files[p].remove(line)
-            del self._breakpoint_conditions[(p, line)]
+            self._breakpoint_conditions.pop((p, line), None)
+            self._breakpoint_hits.pop((p, line), None)
+            self._breakpoint_ignores.pop((p, line), None)
+            self._temporary_breakpoints.discard((p, line))
+            self._logpoints.pop((p, line), None)
+            self._breakpoint_tasks.pop((p, line), None)
+            self._code_has_breakpoint.clear()
             print(f"Breakpoint {file}:{line} removed")
         else:
             print(f"Breakpoint {file}:{line} does not exist")
 
-    def get_breakpoints(self) -> List[Tuple[Path, int, Optional[str]]]:
+    def _resolve_module(self, file: str, code: types.CodeType) -> types.CodeType:
+        """
+        called with the code of the module of `file` before it runs, by the import hook for modules with
+        breakpoints and by `run` for the main script; returns the code to run
+        """
+        codes = list(_walk_codes(code))
+        self._file_codes[file] = codes
+        self._file_lines[file] = _lines_with_code(codes)
+        for line in sorted(self._breakpoints_in_files.get(file, ())):
+            self._check_breakpoint_line(file, line)
+        return code
+
+    def _imported_module_lines(self, file: str) -> Optional[Set[int]]:
+        # lines with code of a module imported before its first breakpoint, None if it is not imported
+        for module in list(sys.modules.values()):
+            module_file = getattr(module, "__file__", None)
+            if module_file and self._canonic(module_file) == file:
+                try:
+                    code = module.__spec__.loader.get_code(module.__name__)
+                except Exception:
+                    return None
+                if code is None:
+                    return None
+                return _lines_with_code(list(_walk_codes(code)))
+        return None
+
+    def _check_breakpoint_line(self, file: str, line: int):
+        lines = self._file_lines.get(file)
+        if lines is None:
+            lines = self._imported_module_lines(file)
+            if lines is None:
+                # checked by `_resolve_module` once the module is imported
+                return
+            self._file_lines[file] = lines
+        if line not in lines:
+            following = [l for l in lines if l > line]
+            hint = f", the next line with code is {min(following)}" if following else ""
+            print(f"Breakpoint {file}:{line} is on a line without code and never stops{hint}")
+
+    def get_breakpoints(self) -> List[Tuple[str, int, Optional[str]]]:
         breakpoints = []
         for p in self._breakpoints_in_files.keys():
             for line in self._breakpoints_in_files[p]:
                 if (p, line) in self._breakpoint_conditions:
                     breakpoints.append(
-                        (p, line, self._breakpoint_conditions[(p, line)])
+                        (p, line, self._breakpoint_conditions[(p, line)].source)
                     )
                 else:
                     breakpoints.append((p, line, None))
 
         return breakpoints
 
+    def _task_name(self, task) -> str:
+        return task if isinstance(task, str) else task.get_name()
+
+    def _in_task(self, task) -> bool:
+        current = _current_task()
+        return current is not None and (current is task or current.get_name() == task)
+
+    def add_function_breakpoint(self, name: str, condition: Optional[str] = None):
+        compiled_condition = None
+        if condition:
+            compiled_condition = self._compile_condition(name, 0, condition)
+            if compiled_condition is None:
+                return
+        self._function_breakpoints[name] = compiled_condition
+        self._event_breakpoints_changed()
+        print(f"Breakpoint at function {name}" + (f" if {condition}" if condition else ""))
+
+    def add_exception_breakpoint(self, name: str = "Exception", when: str = "raised"):
+        if when not in ("raised", "caught", "uncaught"):
+            print(f"Exception breakpoints stop when the exception is raised, caught or uncaught, not {when!r}")
+            return
+        self._exception_breakpoints[name] = when
+        self._event_breakpoints_changed()
+        print(f"Breakpoint on {when} {name}")
+
+    def add_return_breakpoint(self, name: str, condition: Optional[str] = None):
+        compiled_condition = None
+        if condition:
+            compiled_condition = self._compile_condition(name, 0, condition)
+            if compiled_condition is None:
+                return
+        self._return_breakpoints[name] = compiled_condition
+        self._event_breakpoints_changed()
+        print(f"Breakpoint at return of {name}" + (f" if {condition}" if condition else ""))
+
+    def remove_event_breakpoint(self, name: str):
+        removed = False
+        for breakpoints in (
+            self._function_breakpoints,
+            self._exception_breakpoints,
+            self._return_breakpoints,
+        ):
+            if name in breakpoints:
+                del breakpoints[name]
+                removed = True
+        if removed:
+            self._event_breakpoints_changed()
+            print(f"Breakpoints on {name} removed")
+        else:
+            print(f"There is no function, exception or return breakpoint on {name}")
+
+    def _event_breakpoints_changed(self):
+        self._code_event_names.clear()
+        self._has_event_breakpoints = bool(
+            self._function_breakpoints or self._exception_breakpoints or self._return_breakpoints
+        )
+        if (
+            "uncaught" in self._exception_breakpoints.values()
+            and threading.excepthook != self._thread_excepthook
+        ):
+            self._previous_thread_excepthook = threading.excepthook
+            threading.excepthook = self._thread_excepthook
+
+    def _share_console(self) -> ProcessConsole:
+        if self._process_console is None:
+            self._process_console = ProcessConsole(console_lock_path())
+            atexit.register(self._remove_console_lock)
+        return self._process_console
+
+    def _remove_console_lock(self):
+        # forked children inherit the atexit handlers, only the first process owns the lock file
+        if os.getpid() == self._root_pid:
+            try:
+                os.remove(self._process_console.lock_path)
+            except OSError:
+                pass
+
+    def _hold_console(self):
+        # the client of --remote serves the stops of all processes at once, --commands needs no terminal
+        if self._process_console is None or self._remote is not None or self._session is not None:
+            return nullcontext()
+        return self._process_console.hold()
+
+    def _after_fork_in_child(self):
+        # only the forking thread lives on, the locks other threads held would never be released
+        self._stop_lock = threading.Lock()
+        self._resume = threading.Event()
+        self._parked_by = None
+        # stepping belongs to the parent, the child only stops at breakpoints
+        self._single_step = None
+        self._stepping_threads.clear()
+        self._process_console.after_fork()
+        flush_at_child_exit(self._log_buffer)
+        if self._remote is not None:
+            self._remote.after_fork()
+        self._child_started()
+
+    def _child_started(self):
+        if self._untraced_children and not (
+            any(self._breakpoints_in_files.values()) or self._has_event_breakpoints
+        ):
+            # full speed, `breakpoint()` still stops like in --lazy mode
+            self._lazy = True
+            self._remove_tracing()
+
+    def _breakpoint_table(self) -> dict:
+        """the breakpoints and settings of this process as plain data, for `start_child`"""
+
+        def source(condition: Optional[BreakpointCondition]) -> Optional[str]:
+            return condition.source if condition is not None else None
+
+        lines = []
+        for file, line, condition in self.get_breakpoints():
+            key = (file, line)
+            task = self._breakpoint_tasks.get(key)
+            lines.append(
+                (
+                    file,
+                    line,
+                    condition,
+                    self._breakpoint_ignores.get(key, 0),
+                    key in self._temporary_breakpoints,
+                    source(self._logpoints.get(key)),
+                    # tasks do not cross processes, their names do
+                    self._task_name(task) if task is not None else None,
+                )
+            )
+        return {
+            "debugger": type(self).__module__,
+            "root_pid": self._root_pid,
+            "console": self._share_console().lock_path,
+            "main_path": self._main_path,
+            "untraced_children": self._untraced_children,
+            "remote": self._remote.address if self._remote is not None else None,
+            "commands": self._session.path if self._session is not None else None,
+            "thread_policy": self.thread_policy,
+            "filters": (self._include, self._exclude),
+            "lines": lines,
+            "functions": {name: source(c) for name, c in self._function_breakpoints.items()},
+            "exceptions": dict(self._exception_breakpoints),
+            "returns": {name: source(c) for name, c in self._return_breakpoints.items()},
+        }
+
+    def start_child(self, table: dict):
+        """debug this spawned child process like its parent, with the `_breakpoint_table` of the parent"""
+        self._root_pid = table["root_pid"]
+        self._process_console = ProcessConsole(table["console"])
+        self._main_path = table["main_path"]
+        self._is_first_call = False
+        self._untraced_children = table["untraced_children"]
+        if table["remote"]:
+            from nanopdb.remote import RemoteConsole
+
+            self._remote = RemoteConsole(table["remote"])
+        if table["commands"]:
+            from nanopdb.session import CommandSession
+
+            self._session = CommandSession(table["commands"], self._canonic, child=True)
+            self._log_buffer.sink = self._session.log
+        self.thread_policy = table["thread_policy"]
+        self.set_filters(*table["filters"])
+        self._attach_child()
+        # the parent printed them already
+        with redirect_stdout(io.StringIO()):
+            for file, line, condition, ignore, temporary, log, task in table["lines"]:
+                self.add_breakpoint(file, line, condition, ignore, temporary, log, task)
+            for name, condition in table["functions"].items():
+                self.add_function_breakpoint(name, condition)
+            for name, when in table["exceptions"].items():
+                self.add_exception_breakpoint(name, when)
+            for name, condition in table["returns"].items():
+                self.add_return_breakpoint(name, condition)
+        self._child_started()
+
+    def _attach_child(self):
+        sys.breakpointhook = self._breakpoint
+        self._install_import_hook()
+        self._install_tracing()
+
+    def _child_main_loaded(self):
+        """called in spawned children once multiprocessing ran the main script as `__mp_main__`"""
+
+    def _install_import_hook(self):
+        self._import_hook.install()
+        self._import_hook.watch(
+            "multiprocessing.spawn", lambda spawn: patch_spawn(spawn, self._breakpoint_table)
+        )
+
+    def _thread_excepthook(self, args):
+        if self._post_mortem_enabled and args.exc_value is not None:
+            self._previous_thread_excepthook(args)
+            self._post_mortem(args.exc_value)
+            return
+        # an exception that ends a thread, stop where it was raised while its frames are still around
+        tb = args.exc_traceback
+        if tb is not None:
+            while tb.tb_next:
+                tb = tb.tb_next
+            self._stop_at_exception(tb.tb_frame, args.exc_value, "uncaught")
+        self._previous_thread_excepthook(args)
+
+    def enable_stats(self, output: Optional[str] = None):
+        """count events and time the tracer, conditions and console, and dump it as JSON to `output` at exit"""
+        if self._stats is None:
+            from nanopdb.stats import TracerStats
+
+            self._stats = TracerStats()
+            # instance attributes shadow the methods, so every place that hands out `_dispatch_trace`
+            # hands out the wrapper, and nothing is measured as long as stats are off
+            trace = self._dispatch_trace
+            self._dispatch_trace = self._stats.wrap_trace_function(trace)
+            self._eval_condition = self._stats.wrap_condition(self._eval_condition)
+            self._eval = self._stats.wrap_console(self._eval)
+            if sys.gettrace() == trace:
+                self._install_tracing()
+            for frame in sys._current_frames().values():
+                while frame:
+                    if frame.f_trace == trace:
+                        frame.f_trace = self._dispatch_trace
+                    frame = frame.f_back
+        if output:
+            atexit.register(self._stats.dump, output)
+
+    def _post_mortem(self, exc: BaseException):
+        # the frames of a traceback keep their locals, and f_lineno is where each of them was
+        frames = []
+        tb = exc.__traceback__
+        while tb is not None:
+            if not self._is_debugger_frame(tb.tb_frame):
+                frames.append(tb.tb_frame)
+            tb = tb.tb_next
+        if not frames:
+            return
+        print("Post mortem, up() and down() move along the traceback")
+        self._breakpoint(frames[-1], reason="post-mortem", stack=frames)
+
+    def set_filters(
+        self, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None
+    ):
+        if include is not None:
+            self._include = list(include)
+        if exclude is not None:
+            self._exclude = list(exclude)
+        self._code_filtered.clear()
+
+    def _is_filtered(self, frame: types.FrameType) -> bool:
+        code = frame.f_code
+        filtered = self._code_filtered.get(code)
+        if filtered is None:
+            file = self._code_file(code)
+            names = (file, frame.f_globals.get("__name__") or "")
+            if self._is_debugger_frame(frame):
+                filtered = True
+            elif any(fnmatchcase(name, pattern) for pattern in self._include for name in names):
+                filtered = False
+            elif file == self._main_path:
+                filtered = False
+            else:
+                filtered = any(
+                    fnmatchcase(name, pattern) for pattern in self._exclude for name in names
+                )
+            self._code_filtered[code] = filtered
+        return filtered
+
+    def _unfiltered_caller(self, frame: types.FrameType) -> Optional[types.FrameType]:
+        # where stepping out of `frame` continues, library code in between is stepped over
+        back = frame.f_back
+        while back is not None and self._is_filtered(back):
+            back = back.f_back
+        if back is None or self._is_debugger_frame(back):
+            return None
+        return back
+
+    def _canonic(self, file: str) -> str:
+        # the main script is compiled under its bare name, see `run`
+        if file == self._main_file and self._main_path:
+            return self._main_path
+        if file.startswith("<") and file.endswith(">"):
+            return sys.intern(file)
+        return sys.intern(os.path.realpath(file))
+
+    def _code_file(self, code: types.CodeType) -> str:
+        file = self._code_files.get(code)
+        if file is None:
+            file = self._code_files[code] = self._canonic(code.co_filename)
+        return file
+
+    def _code_line_range(self, code: types.CodeType) -> Tuple[int, int]:
+        line_range = self._code_line_ranges.get(code)
+        if line_range is None:
+            lines = [line for _, _, line in code.co_lines() if line is not None]
+            if lines:
+                line_range = (min(lines), max(lines))
+            else:
+                line_range = (code.co_firstlineno, code.co_firstlineno)
+            self._code_line_ranges[code] = line_range
+        return line_range
+
+    def _has_breakpoint_in(self, code: types.CodeType) -> bool:
+        has_breakpoint = self._code_has_breakpoint.get(code)
+        if has_breakpoint is None:
+            lines = self._breakpoints_in_files.get(self._code_file(code))
+            first, last = self._code_line_range(code)
+            has_breakpoint = bool(lines) and any(first <= l <= last for l in lines)
+            self._code_has_breakpoint[code] = has_breakpoint
+        return has_breakpoint
+
+    def _trace_frames_with_breakpoint(self):
+        # frames already running skipped their `call` event, so hook them up directly
+        if sys.gettrace() is None:
+            return
+        for frame in sys._current_frames().values():
+            while frame:
+                if self._has_breakpoint_in(frame.f_code):
+                    # frames traced for function, exception and return breakpoints may skip lines
+                    frame.f_trace_lines = True
+                    if frame.f_trace is None:
+                        frame.f_trace = self._dispatch_trace
+                frame = frame.f_back
+
+    def _install_tracing(self, trace: Optional[Callable] = None):
+        trace = trace or self._dispatch_trace
+        # see https://docs.python.org/3.11/library/sys.html#sys.settrace
+        # and https://docs.python.org/3.12/library/threading.html#threading.settrace_all_threads
+        if hasattr(threading, "settrace_all_threads"):
+            threading.settrace_all_threads(trace)
+        else:
+            threading.settrace(trace)
+            sys.settrace(trace)
+
+    def _remove_tracing(self):
+        if hasattr(threading, "settrace_all_threads"):
+            threading.settrace_all_threads(None)
+        else:
+            threading.settrace(None)
+            sys.settrace(None)
+        for frame in sys._current_frames().values():
+            while frame:
+                frame.f_trace = None
+                frame = frame.f_back
+
+    def _on_attach_signal(self, signum: int, frame: types.FrameType):
+        if self._attach_pending or sys.gettrace() is not None:
+            return
+        if not hasattr(threading, "settrace_all_threads"):
+            print("nanopdb: before Python 3.12 only the main thread and new threads are traced")
+        self._install_tracing(self._attach_trace)
+        # frames already on the stack never see a `call` event, trace them directly
+        for top in sys._current_frames().values():
+            while top:
+                if not self._is_debugger_frame(top):
+                    top.f_trace = self._attach_trace
+                top = top.f_back
+        # last, so that the calls made by this handler are not where we stop
+        self._attach_pending = True
+
+    def _attach_trace(self, frame: types.FrameType, event: str, arg):
+        # trace function of every thread from the attach signal until the first line runs
+        if not self._attach_pending:
+            return self._dispatch_trace(frame, event, arg)
+        if event == "call":
+            return self._attach_trace
+        if event == "line":
+            self._attach_pending = False
+            self._install_tracing()
+            self._breakpoint(frame, reason="attach")
+            return self._dispatch_trace
+
+    def _start_recording(
+        self, frame: types.FrameType, capacity: int = 100000, snapshot_locals: bool = False
+    ):
+        self._recorder = EventRecorder(capacity, snapshot_locals)
+        if sys.gettrace() is None:
+            self._install_tracing()
+        # frames already running skipped their `call` event, start recording their lines now
+        depth = 0
+        while frame:
+            if not self._is_debugger_frame(frame):
+                depth += 1
+                if frame.f_trace is None:
+                    frame.f_trace = self._dispatch_trace
+            frame = frame.f_back
+        self._thread_state.record_depth = depth
+
+    def _record(self, frame: types.FrameType, event: str):
+        state = self._thread_state
+        depth = state.record_depth
+        if event == "call":
+            depth = state.record_depth = depth + 1
+        elif event == "return":
+            state.record_depth = depth - 1
+        self._recorder.record(frame, EVENT_CODES[event], depth)
+
+    def _park_threads(self):
+        if self.thread_policy != "park":
+            return
+        self._parked_by = threading.get_ident()
+        self._resume.clear()
+        # make every other thread see a `line` event soon, where `_dispatch_trace` parks it
+        for ident, frame in sys._current_frames().items():
+            if ident != self._parked_by:
+                frame.f_trace_lines = True
+                if frame.f_trace is None:
+                    frame.f_trace = self._dispatch_trace
+
+    def _unpark_threads(self):
+        if self._parked_by is not None:
+            self._parked_by = None
+            self._resume.set()
+
+    def _wait_if_parked(self):
+        if self._parked_by is not None and self._parked_by != threading.get_ident():
+            self._resume.wait()
+
     def _breakpoint(
-        self, frame: types.FrameType = None, reason: str = "breakpoint", *args, **kwargs
+        self,
+        frame: types.FrameType = None,
+        reason: str = "breakpoint",
+        *args,
+        stack: Optional[List[types.FrameType]] = None,
+        **kwargs,
     ):
+        """
+        stack (default:the callers of frame) the frames up() and down() move between, outermost first,
+        e.g. the frames of a traceback
+        """
         if self._in_breakpoint:
             return
 
         frame = frame or sys._getframe(1)
-        location = (
-            f"{frame.f_code.co_filename}:{frame.f_lineno} ({frame.f_code.co_name})"
-        )
+        if stack is None:
+            stack = []
+            caller = frame
+            while caller is not None:
+                if not self._is_debugger_frame(caller):
+                    stack.append(caller)
+                caller = caller.f_back
+            stack.reverse()
+        # the frame the console looks at, moved by up() and down()
+        selected = {"index": stack.index(frame) if frame in stack else len(stack) - 1}
+
+        def _where(f: types.FrameType) -> str:
+            return f"{f.f_code.co_filename}:{f.f_lineno} ({f.f_code.co_name})"
+
+        location = _where(frame)
 
         helpers = {}
+        namespace = FrameNamespace(frame, helpers)
 
         def add_helper(f: Callable) -> Callable:
             helpers[f.__name__.lstrip("_")] = f
@@ -125,35 +1025,337 @@ class NanoPDB:
             """show the current location"""
             return location
 
+        def _select(index: int):
+            nonlocal frame, location
+            if not 0 <= index < len(stack):
+                print("Oldest frame" if index < 0 else "Newest frame")
+                return
+            selected["index"] = index
+            frame = stack[index]
+            location = _where(frame)
+            namespace.select(frame)
+            print(location)
+
+        @add_helper
+        def up(n: int = 1):
+            """move n frames up, to the caller, and look at its locals"""
+            _select(selected["index"] - n)
+
+        @add_helper
+        def down(n: int = 1):
+            """move n frames down, towards where it stopped"""
+            _select(selected["index"] + n)
+
+        @add_helper
+        def where():
+            """show the frames up() and down() move between, the selected one is marked with >"""
+            for i, f in enumerate(stack):
+                print(f"{'>' if i == selected['index'] else ' '} {_where(f)}")
+
         @add_helper
         def _locals():
             return frame.f_locals
 
+        @add_helper
+        def _show(value, page: int = 0, size: int = 20):
+            """
+            show the type, length, shape, dtype and size of value, and page `page` of its items, each of them cut,
+            e.g. show(big_list, page=3); nothing beyond that page is looked at
+            """
+            show(value, page, size)
+
         @add_helper
         def _glocals():
             return frame.f_globals
 
         @add_helper
-        def break_at_line(line: int, condition: Optional[str] = None):
+        def break_at_line(
+            line: int, condition: Optional[str] = None, ignore: int = 0, temporary=False, task=None
+        ):
+            """
+            condition (default:None) to only stop when it is true,
+            ignore (default:0) to skip the first `ignore` hits, i.e. stop on hit ignore+1,
+            temporary (default:False) to remove the breakpoint on its first stop,
+            task (default:None) an asyncio.Task or task name to only stop in, e.g. current_task()
+            """
             file = frame.f_code.co_filename
-            self.add_breakpoint(file, line, condition)
+            self.add_breakpoint(file, line, condition, ignore, temporary, task=task)
+
+        @add_helper
+        def break_at_file_line(
+            file: str,
+            line: int,
+            condition: Optional[str] = None,
+            ignore: int = 0,
+            temporary=False,
+            task=None,
+        ):
+            self.add_breakpoint(file, line, condition, ignore, temporary, task=task)
+
+        @add_helper
+        def tbreak_at_line(line: int, condition: Optional[str] = None):
+            """set a temporary breakpoint, removed on its first stop"""
+            break_at_line(line, condition, temporary=True)
 
         @add_helper
-        def break_at_file_line(file: str, line: int, condition: Optional[str] = None):
-            self.add_breakpoint(file, line, condition)
+        def break_at_function(name: str, condition: Optional[str] = None):
+            """stop when a function named `name`, e.g. "fib", "Cls.method" or "module.fib", is called"""
+            self.add_function_breakpoint(name, condition)
+
+        @add_helper
+        def break_on_exception(name: str = "Exception", when: str = "raised"):
+            """
+            stop on exceptions of the class `name` or a subclass of it,
+            when (default:"raised") "raised" where raised, "caught" once handled without raising it again,
+            "uncaught" before the program ends
+            """
+            self.add_exception_breakpoint(name, when)
+
+        @add_helper
+        def break_on_return(name: str, condition: Optional[str] = None):
+            """stop when a function named `name` returns, condition can use the return value `retval`"""
+            self.add_return_breakpoint(name, condition)
+
+        @add_helper
+        def clear_event_break(name: str):
+            """remove the function, exception and return breakpoints on `name`"""
+            self.remove_event_breakpoint(name)
+
+        @add_helper
+        def log_at_line(line: int, message: str, condition: Optional[str] = None):
+            """
+            log the f-string `message`, e.g. "i={i}", every time the line is hit, without stopping
+            """
+            file = frame.f_code.co_filename
+            self.add_breakpoint(file, line, condition, log=message)
+
+        @add_helper
+        def log_at_file_line(
+            file: str, line: int, message: str, condition: Optional[str] = None
+        ):
+            self.add_breakpoint(file, line, condition, log=message)
+
+        @add_helper
+        def logs(n: int = 20):
+            """show the last n logpoint messages"""
+            for message in self._log_buffer.tail(n):
+                print(message)
+            if self._log_buffer.dropped:
+                print(f"({self._log_buffer.dropped} messages dropped before being flushed)")
+
+        @add_helper
+        def log_to(sink: Optional[str] = "stderr", batch: Optional[int] = None):
+            """
+            sink (default:"stderr") "stderr", a file to append to, or None to keep messages in memory,
+            batch (default:unchanged) number of messages written at once
+            """
+            self._log_buffer.flush()
+            self._log_buffer.sink = sink
+            if batch:
+                self._log_buffer.batch = batch
+
+        @add_helper
+        def filters(include: Optional[List[str]] = None, exclude: Optional[List[str]] = None):
+            """
+            include (default:unchanged) and exclude (default:unchanged) glob patterns on file paths and
+            module names, e.g. ["mylib.*"] or ["*/vendor/*"]; excluded frames are not stepped into nor
+            recorded, include wins over exclude, the stdlib and site-packages are excluded by default
+            """
+            self.set_filters(include, exclude)
+            print(f"include: {self._include}")
+            print(f"exclude: {self._exclude}")
+
+        @add_helper
+        def stats(n: int = 10):
+            """show the events and time spent in the debugger per type, file, function and condition"""
+            if self._stats is None:
+                self.enable_stats()
+                print("Counting from now on, call stats() again later")
+                return
+            print(self._stats.report(n))
+
+        @add_helper
+        def detach():
+            """remove the tracer from all threads and continue at full speed"""
+            self._single_step_instead_of_continue = False
+            self._single_step = None
+            self._remove_tracing()
+            raise SystemExit(NanoPDBContinue(exit=False))
+
+        @add_helper
+        def threads():
+            """show where every thread is, the current one is marked with *"""
+            frames = sys._current_frames()
+            for thread in threading.enumerate():
+                f = frames.get(thread.ident)
+                if thread.ident == threading.get_ident():
+                    f = frame
+                where = f"{f.f_code.co_filename}:{f.f_lineno} ({f.f_code.co_name})" if f else "?"
+                mark = "*" if thread.ident == threading.get_ident() else " "
+                print(f"{mark} {thread.name} ({thread.ident}): {where}")
+
+        @add_helper
+        def current_task():
+            """the asyncio.Task that stopped, None outside of a task"""
+            return _current_task()
+
+        @add_helper
+        def tasks():
+            """show where every asyncio task of the running loop awaits, the current one is marked with *"""
+            current = _current_task()
+            if current is None:
+                print("No asyncio task is running")
+                return
+            for task in sys.modules["asyncio"].all_tasks():
+                # follow the chain of awaited coroutines down to the innermost one
+                f = None
+                coro = task.get_coro()
+                while coro is not None:
+                    f = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or f
+                    coro = getattr(coro, "cr_await", None)
+                if task is current:
+                    f = frame
+                where = _where(f) if f else "?"
+                print(f"{'*' if task is current else ' '} {task.get_name()}: {where}")
+
+        @add_helper
+        def thread_policy(policy: Optional[str] = None):
+            """
+            policy "run" to let other threads run while a thread is stopped,
+            "park" to make them wait at their next traced line until it continues
+            """
+            if policy is not None:
+                assert policy in ("run", "park")
+                self.thread_policy = policy
+            return self.thread_policy
 
         @add_helper
         def list_break():
             breakpoints = self.get_breakpoints()
-            if len(breakpoints) == 0:
+            if len(breakpoints) == 0 and not self._has_event_breakpoints:
                 print("There is no breakpoint")
                 return
+            for name, condition in self._function_breakpoints.items():
+                print(f"Break at function {name}" + (f" if {condition.source}" if condition else ""))
+            for name, when in self._exception_breakpoints.items():
+                print(f"Break on {when} {name}")
+            for name, condition in self._return_breakpoints.items():
+                print(f"Break at return of {name}" + (f" if {condition.source}" if condition else ""))
             for bk in breakpoints:
                 path, line, condition = bk
-                if condition is None:
-                    print(f"Break at {path}:{line}")
+                logpoint = self._logpoints.get((path, line))
+                if logpoint is None:
+                    description = f"Break at {path}:{line}"
                 else:
-                    print(f"Break at {path}:{line} if {condition}")
+                    description = f"Log {logpoint.source!r} at {path}:{line}"
+                    if logpoint.errors:
+                        description += f" ({logpoint.errors} errors)"
+                if condition is not None:
+                    description += f" if {condition}"
+                    errors = self._breakpoint_conditions[(path, line)].errors
+                    if errors:
+                        description += f" ({errors} errors)"
+                task = self._breakpoint_tasks.get((path, line))
+                if task is not None:
+                    description += f" in task {self._task_name(task)}"
+                if (path, line) in self._temporary_breakpoints:
+                    description += " (temporary)"
+                description += f", hit {self._breakpoint_hits.get((path, line), 0)} times"
+                ignore = self._breakpoint_ignores.get((path, line))
+                if ignore:
+                    description += f", ignore next {ignore} hits"
+                print(description)
+
+        @add_helper
+        def record(enable: bool = True, capacity: int = 100000, snapshot_locals: bool = False):
+            """
+            enable (default:True) to start a new recording of every call, line and return, False to stop,
+            capacity (default:100000) number of events kept, older ones are overwritten,
+            snapshot_locals (default:False) to also keep the int/float/bool/short str locals of every line
+            """
+            if enable:
+                self._start_recording(frame, capacity, snapshot_locals)
+            else:
+                self._recorder = None
+
+        # position of `back()` and `forward()` in the recorded line events, 0 is the current line
+        travel = {"line_ages": None, "position": 0}
+
+        def _recorder() -> Optional[EventRecorder]:
+            if self._recorder is None:
+                print("Nothing is recorded, see record()")
+            return self._recorder
+
+        @add_helper
+        def history(n: int = 20):
+            """show the last n recorded events, oldest first, indented by frame depth"""
+            recorder = _recorder()
+            if recorder is None:
+                return
+            for age in reversed(range(min(n, len(recorder)))):
+                print(recorder.describe(age))
+
+        @add_helper
+        def back(n: int = 1):
+            """go back n recorded lines and show where the program was then"""
+            recorder = _recorder()
+            if recorder is None:
+                return
+            if travel["line_ages"] is None:
+                travel["line_ages"] = recorder.line_ages()
+            line_ages = travel["line_ages"]
+            if not line_ages:
+                print("No line is recorded")
+                return
+            travel["position"] = min(max(travel["position"] + n, 0), len(line_ages) - 1)
+            print(recorder.describe(line_ages[travel["position"]], source=True))
+
+        @add_helper
+        def forward(n: int = 1):
+            """go forward n recorded lines, towards the current one"""
+            back(-n)
+
+        @add_helper
+        def where_was(var: str, n: int = 10):
+            """show the last n recorded lines where the local `var` had a new value, needs snapshot_locals"""
+            recorder = _recorder()
+            if recorder is None:
+                return
+            changes = []
+            missing = object()
+            last = missing
+            for age in reversed(recorder.line_ages()):
+                snapshot = recorder.event(age)[4]
+                if snapshot is None:
+                    continue
+                value = snapshot.get(var, missing)
+                if value is not missing and (last is missing or value != last):
+                    changes.append((age, value))
+                    last = value
+            if not changes:
+                print(f"No recorded value of {var}, see record(snapshot_locals=True)")
+            for age, value in changes[-n:]:
+                print(f"{var} = {value!r} before {recorder.describe(age, source=True)}")
+
+        @add_helper
+        def profile_here(n: int = 20):
+            """
+            start sampling the stacks of all threads when the program continues,
+            call it again to stop and show the top n functions. Only at a stop in the main thread
+            """
+            if threading.current_thread() is not threading.main_thread():
+                # SIGPROF handlers can only be set by the main thread
+                print("profile_here() only works at a stop in the main thread")
+                return
+            if self._profiler is not None and self._profiler.running:
+                self._profiler.stop()
+                print(self._profiler.report(n))
+            else:
+                from nanopdb.profiler import SamplingProfiler
+
+                self._profiler = SamplingProfiler(skip=self._is_debugger_frame)
+                self._profiler.start()
+                print("Sampling, call profile_here() again to stop")
 
         def _step_setup(into=False, out=False):
             assert not (into and out)
@@ -192,37 +1394,292 @@ class NanoPDB:
 
         self._in_breakpoint = True
         message = f"breakpoint at {location}"
-        self._eval(_locals=frame.f_locals | frame.f_globals | helpers, message=message)
+        if os.getpid() != self._root_pid:
+            message += f" in process {os.getpid()}"
+        if threading.current_thread() is not threading.main_thread():
+            message += f" in thread {threading.current_thread().name}"
+        task = _current_task()
+        if task is not None:
+            message += f" in task {task.get_name()}"
+        with self._stop_lock:
+            self._park_threads()
+            try:
+                self._log_buffer.flush()
+                # nothing is copied, so that big modules stop instantly and locals can be assigned
+                with self._hold_console():
+                    self._eval(_locals=namespace, message=message)
+            finally:
+                self._unpark_threads()
 
         if self._single_step_instead_of_continue:
             _step_setup(
                 self._single_step_instead_of_continue_into,
                 self._single_step_instead_of_continue_out,
             )
+        if self._single_step and sys.gettrace() is None and self._lazy:
+            # stepping from a `breakpoint()` call while detached
+            self._install_tracing()
+        if self._single_step and sys.gettrace() is not None:
+            # the stepped frame may have been left untraced, or without line events, by `_default_dispatch`
+            self._single_step.frame.f_trace = self._dispatch_trace
+            self._single_step.frame.f_trace_lines = True
 
         self._in_breakpoint = False
 
     def _should_break_at(self, frame: types.FrameType):
-        p = Path(frame.f_code.co_filename)
-        line = frame.f_lineno
-        if p in self._breakpoints_in_files and line in self._breakpoints_in_files[p]:
-            if (p, line) in self._breakpoint_conditions:
-                return eval(
-                    self._breakpoint_conditions[(p, line)],
-                    frame.f_globals,
-                    frame.f_locals,
-                )
+        # only dict lookups keyed on the code object and interned strings, no allocation until a hit
+        code = frame.f_code
+        p = self._code_files.get(code) or self._code_file(code)
+        lines = self._breakpoints_in_files.get(p)
+        if lines and frame.f_lineno in lines:
+            line = frame.f_lineno
+            key = (p, line)
+            task = self._breakpoint_tasks.get(key)
+            if task is not None and not self._in_task(task):
+                # hits in other tasks neither count nor use up ignores
+                return False
+            self._breakpoint_hits[key] += 1
+            # hit counts are cheaper than any condition, so check them first
+            ignore = self._breakpoint_ignores.get(key)
+            if ignore:
+                self._breakpoint_ignores[key] = ignore - 1
+                return False
+            condition = self._breakpoint_conditions.get(key)
+            if condition is not None and not self._eval_condition(
+                condition, frame, f"{p}:{line}"
+            ):
+                return False
+            logpoint = self._logpoints.get(key)
+            if key in self._temporary_breakpoints:
+                self.remove_breakpoint(p, line)
+            if logpoint is not None:
+                self._log(logpoint, frame)
+                return False
             return True
         return False
 
+    def _log(self, logpoint: BreakpointCondition, frame: types.FrameType):
+        try:
+            message = eval(logpoint.code, frame.f_globals, frame.f_locals)
+        except Exception as e:
+            logpoint.errors += 1
+            message = f"<{type(e).__name__} in {logpoint.source!r}: {e}>"
+        self._log_buffer.append(f"{frame.f_code.co_filename}:{frame.f_lineno}: {message}")
+
+    def _eval_condition(
+        self,
+        condition: BreakpointCondition,
+        frame: types.FrameType,
+        location: str,
+        extra_locals: Optional[dict] = None,
+    ) -> bool:
+        _locals = frame.f_locals
+        if extra_locals:
+            _locals = {**_locals, **extra_locals}
+        try:
+            return bool(eval(condition.code, frame.f_globals, _locals))
+        except Exception as e:
+            # never let a broken condition raise into the debuggee, stop and show it instead (like pdb)
+            condition.errors += 1
+            print(
+                f"Error in condition of breakpoint {location} ({condition.source}): "
+                f"{type(e).__name__}: {e}"
+            )
+            return True
+
     def _handle_line(self, frame: types.FrameType):
         if self._should_break_at(frame):
             self._breakpoint(frame, reason="breakpoint")
 
+    def _event_names(self, frame: types.FrameType) -> Tuple[Optional[str], Optional[str]]:
+        code = frame.f_code
+        names = self._code_event_names.get(code)
+        if names is None:
+            module = frame.f_globals.get("__name__")
+            candidates = (code.co_qualname, f"{module}.{code.co_qualname}")
+            names = self._code_event_names[code] = (
+                next((n for n in candidates if n in self._function_breakpoints), None),
+                next((n for n in candidates if n in self._return_breakpoints), None),
+            )
+        return names
+
+    def _is_stepped_into(self, frame: types.FrameType, step: Optional[StepState]) -> bool:
+        if step is None:
+            return False
+        if step.mode == StepMode.into:
+            return not self._is_filtered(frame)
+        return frame is step.frame
+
+    def _is_suspending(self, frame: types.FrameType) -> bool:
+        """whether the `return` event of `frame` only suspends a coroutine at an `await`"""
+        return bool(frame.f_code.co_flags & CO_ASYNC) and self._is_yielding(frame)
+
+    def _is_yielding(self, frame: types.FrameType) -> bool:
+        """whether the `return` event of `frame` comes from a `yield` or an `await`"""
+        lasti = frame.f_lasti - _YIELD_LASTI_OFFSET
+        return lasti >= 0 and frame.f_code.co_code[lasti] == _YIELD_VALUE
+
+    def _wants_lines(self, frame: types.FrameType) -> bool:
+        if self._has_breakpoint_in(frame.f_code):
+            return True
+        return bool(self._stepping_threads) and self._is_stepped_into(frame, self._single_step)
+
+    def _dispatch_events(self, frame: types.FrameType):
+        # function, exception and return breakpoints need the call, exception and return events of
+        # every frame, but not its line events
+        if self._is_debugger_frame(frame):
+            return
+        self._stop_at_call(frame)
+        wants_lines = self._wants_lines(frame)
+        if not wants_lines and self._is_filtered(frame) and self._event_names(frame)[1] is None:
+            return
+        frame.f_trace_lines = wants_lines
+        return self._dispatch_trace
+
+    def _stop_at_call(self, frame: types.FrameType) -> bool:
+        function_name, _ = self._event_names(frame)
+        if function_name is None:
+            return False
+        condition = self._function_breakpoints[function_name]
+        if condition is None or self._eval_condition(condition, frame, function_name):
+            self._breakpoint(frame, reason="function")
+            return True
+        return False
+
+    def _stop_at_return(self, frame: types.FrameType, retval) -> bool:
+        _, return_name = self._event_names(frame)
+        if return_name is None:
+            return False
+        condition = self._return_breakpoints[return_name]
+        if condition is None or self._eval_condition(
+            condition, frame, return_name, {"retval": retval}
+        ):
+            print(f"{frame.f_code.co_qualname} returns {short_repr(retval)}")
+            self._breakpoint(frame, reason="return")
+            step = self._single_step
+            if step and step.frame is frame and frame.f_back is not None:
+                # the frame is gone after this event, continue stepping in its caller
+                step.frame = frame.f_back
+                step.frame.f_trace = self._dispatch_trace
+                step.frame.f_trace_lines = True
+            return True
+        return False
+
+    def _stop_at_exception(self, frame: types.FrameType, exc: BaseException, when: str) -> bool:
+        if self._exception_breakpoint_for(type(exc)) != when or self._is_debugger_frame(frame):
+            return False
+        print(f"{type(exc).__name__} {when}: {exc}")
+        self._breakpoint(frame, reason="exception")
+        return True
+
+    def _exception_breakpoint_for(self, exc_type: type) -> Optional[str]:
+        for cls in exc_type.__mro__:
+            when = self._exception_breakpoints.get(cls.__name__) or self._exception_breakpoints.get(
+                f"{cls.__module__}.{cls.__qualname__}"
+            )
+            if when:
+                return when
+        return None
+
+    def _is_outermost_frame(self, frame: types.FrameType) -> bool:
+        # the main script's module frame is run by `run`, threads are served by `_thread_excepthook`
+        return frame.f_back is None or self._is_debugger_frame(frame.f_back)
+
+    def _raised_here(self, tb: types.TracebackType) -> bool:
+        # the traceback starts at the raising frame, and grows a frame for every frame it goes through;
+        # exceptions raised in filtered frames count as raised in the first unfiltered one
+        if tb is None:
+            # the StopIteration that ends an `await` or `yield from` inside the generator, see bdb
+            return False
+        tb = tb.tb_next
+        while tb is not None:
+            if not self._is_filtered(tb.tb_frame):
+                return False
+            tb = tb.tb_next
+        return True
+
+    def _handle_exception(self, frame: types.FrameType, arg) -> bool:
+        exc_type, exc, tb = arg
+        if tb is None:
+            # the StopIteration that ends an `await` or `yield from` inside the generator, see bdb
+            return False
+        unwinding = self._thread_state.unwinding
+        unwinding[frame] = exc
+        # a line once the frame is done handling it tells that this frame caught it, see `_handle_caught`,
+        # the return event whether it did not
+        frame.f_trace_lines = True
+        return self._raised_here(tb) and self._stop_at_exception(frame, exc, "raised")
+
+    def _handle_caught(self, frame: types.FrameType) -> bool:
+        unwinding = self._thread_state.unwinding
+        exc = unwinding[frame]
+        if self._is_handling(frame, exc):
+            return False
+        del unwinding[frame]
+        frame.f_trace_lines = self._wants_lines(frame)
+        return self._stop_at_exception(frame, exc, "caught")
+
+    def _is_handling(self, frame: types.FrameType, exc: BaseException) -> bool:
+        # entering or in a handler: an `except` body, but also a `finally` body or the exit of a `with`,
+        # which raise it again at their end. It is caught once the frame goes on after the handler
+        return sys.exc_info()[1] is exc or frame.f_code.co_code[frame.f_lasti] == _PUSH_EXC_INFO
+
+    def _is_returning(self, frame: types.FrameType) -> bool:
+        # a return event comes from a return instruction, or from an exception leaving the frame
+        return frame.f_code.co_code[frame.f_lasti] in _RETURNS
+
+    def _handle_return(self, frame: types.FrameType, retval) -> bool:
+        if self._is_yielding(frame):
+            # an exception being handled stays with the suspended frame
+            return not self._is_suspending(frame) and self._stop_at_return(frame, retval)
+        exc = self._thread_state.unwinding.pop(frame, None)
+        if not self._is_returning(frame):
+            # leaving because of the exception, not with a value
+            if exc is None:
+                return False
+            return self._is_outermost_frame(frame) and self._stop_at_exception(frame, exc, "uncaught")
+        # e.g. a `return` in its handler, or in a `finally` body
+        stopped = exc is not None and self._stop_at_exception(frame, exc, "caught")
+        return self._stop_at_return(frame, retval) or stopped
+
+    def _handle_event_breakpoints(self, frame: types.FrameType, event: str, arg) -> bool:
+        """serve exception and return breakpoints, true if it stopped"""
+        if event == "exception":
+            return self._handle_exception(frame, arg)
+        elif event == "return":
+            return self._handle_return(frame, arg)
+        elif event == "line" and frame in self._thread_state.unwinding:
+            return self._handle_caught(frame)
+        return False
+
     def _default_dispatch(self, frame: types.FrameType, event: str, arg):
         # return a reference to a trace function
         if event == "call":
-            return self._dispatch_trace
+            if self._recorder is not None and not self._is_debugger_frame(frame):
+                if self._is_filtered(frame) and not self._has_breakpoint_in(frame.f_code):
+                    return self._dispatch_events(frame) if self._has_event_breakpoints else None
+                self._record(frame, event)
+                if self._has_event_breakpoints:
+                    # recorded frames keep all their lines, see `_dispatch_events` for the others
+                    self._stop_at_call(frame)
+                return self._dispatch_trace
+            if self._has_event_breakpoints:
+                return self._dispatch_events(frame)
+            # leave a frame untraced if no breakpoint can fire in it and we are not stepping into it
+            if self._has_breakpoint_in(frame.f_code):
+                return self._dispatch_trace
+            # stepping over or out only needs the stepped frame (resumed generators call again),
+            # callees run untraced, and so do filtered frames when stepping into
+            if self._stepping_threads and self._is_stepped_into(frame, self._single_step):
+                return self._dispatch_trace
+
+    def _is_debugger_frame(self, frame: types.FrameType) -> bool:
+        is_debugger = self._debugger_codes.get(frame.f_code)
+        if is_debugger is None:
+            is_debugger = self._debugger_codes[frame.f_code] = (
+                os.path.dirname(frame.f_code.co_filename) == os.path.dirname(__file__)
+            )
+        return is_debugger
 
     def _should_single_step(self, frame, event):
         if not self._single_step:
@@ -252,28 +1709,76 @@ class NanoPDB:
         # print(f"event: {event}, location: {location}")
         # return self._default_dispatch(frame, event, arg)
 
+        if (
+            event == "call"
+            and self._recorder is None
+            and not self._has_event_breakpoints
+            and not self._is_first_call
+            and self._parked_by is None
+        ):
+            # the calls of the callees of a frame stepped over come here, keep them cheap: the same as
+            # `_default_dispatch`, with the step state read once
+            has_breakpoint = self._code_has_breakpoint.get(frame.f_code)
+            if has_breakpoint is None:
+                has_breakpoint = self._has_breakpoint_in(frame.f_code)
+            if has_breakpoint:
+                return self._dispatch_trace
+            if self._stepping_threads:
+                step = self._thread_state.single_step
+                # like `_is_stepped_into`
+                if step is not None and (
+                    frame is step.frame or step.mode is _STEP_INTO and not self._is_filtered(frame)
+                ):
+                    return self._dispatch_trace
+            return
+
+        if self._parked_by is not None:
+            self._wait_if_parked()
+
+        if self._recorder is not None and event != "call":
+            # `call` events are recorded by `_default_dispatch`, once it decided to trace the frame
+            self._record(frame, event)
+
+        if self._has_event_breakpoints and event != "call":
+            if self._handle_event_breakpoints(frame, event, arg):
+                return
+
         # frame.f_back: pointer to the last frame
         # do not trace when exit the target file
         if (
             event == "return"
             and frame.f_code.co_name == "<module>"
             and frame.f_back
-            and frame.f_back.f_code.co_filename == __file__
+            and self._is_debugger_frame(frame.f_back)
         ):
             return
 
-        if self._is_first_call:
+        if self._is_first_call and self._main_file == frame.f_code.co_filename:
             # break at entrance
-            assert self._main_file == frame.f_code.co_filename
             self._is_first_call = False
             self._breakpoint(frame, reason="start")
             return self._default_dispatch(frame, event, arg)
 
-        if self._should_single_step(frame, event):
+        if self._stepping_threads and self._should_single_step(frame, event):
             if event == "return":
-                if frame.f_back:
-                    self._single_step.frame = frame.f_back
-                    self._breakpoint(frame.f_back, reason="step")
+                if self._is_suspending(frame):
+                    # the event loop resumes the same frame later, keep stepping in it then
+                    return
+                back = self._unfiltered_caller(frame)
+                if back is frame.f_back and back is not None:
+                    self._single_step.frame = back
+                    self._breakpoint(back, reason="step")
+                elif frame.f_code.co_flags & CO_ASYNC:
+                    # the coroutine of a task returns to the event loop, which wakes up whoever awaits
+                    # the task, stop at the next line run outside of the loop
+                    self._single_step.mode = StepMode.into
+                elif back is not None:
+                    # returning into filtered frames, step over them until the code above them runs again
+                    self._single_step.frame = back
+                    if self._single_step.mode == StepMode.out:
+                        self._single_step.mode = StepMode.over
+                    back.f_trace = self._dispatch_trace
+                    back.f_trace_lines = True
                 return
             if self._single_step.mode == StepMode.out:
                 return
@@ -287,12 +1792,95 @@ class NanoPDB:
         elif event == "line":
             self._handle_line(frame)
 
-    def run(self, _globals):
-        file = Path(sys.argv[0])
-        self._main_file = file.name
+    def run(
+        self,
+        _globals,
+        lazy: bool = False,
+        attach_signal: Optional[int] = getattr(signal, "SIGUSR1", None),
+        record: bool = False,
+        record_locals: bool = False,
+        profile: bool = False,
+        profile_output: Optional[str] = None,
+        post_mortem: bool = False,
+        stats: Optional[str] = None,
+        untraced_children: bool = False,
+        remote: Optional[str] = None,
+        commands: Optional[str] = None,
+    ):
+        """
+        lazy (default:False) to run without any tracer until `attach_signal` (default:SIGUSR1)
+        is received, then stop at the next line. `detach()` removes the tracer again.
+        record (default:False) to record every event from the start, see the `record()` helper,
+        record_locals (default:False) to also record the scalar locals of every line
+        profile (default:False) to sample stacks instead of tracing, and show the busiest functions at exit,
+        profile_output (default:None) file to write the folded stacks to
+        post_mortem (default:False) to run without any tracer and only stop on the traceback of an uncaught
+        exception, of the script or of a thread
+        stats (default:None) file to write the event counts and time spent in the debugger to at exit
+        untraced_children (default:False) to run child processes without any breakpoint without tracer
+        remote (default:None) "host:port" or Unix socket path of a `python -m nanopdb.client` to serve
+        the console to, instead of stdin
+        commands (default:None) a session file of breakpoints and of the actions to run at each stop, to debug
+        without a terminal and write the results as JSON lines, see `CommandSession`
+        """
+        file = sys.argv[0]
+        self._main_file = os.path.basename(file)
+        self._main_path = sys.intern(os.path.realpath(file))
         # see https://realpython.com/python-exec/#using-python-for-configuration-files
-        compiled = compile(file.read_text(), filename=file.name, mode="exec")
+        compiled = compile_script(file)
+        compiled = self._resolve_module(self._main_path, compiled)
+        self._install_import_hook()
         sys.breakpointhook = self._breakpoint
-        # see https://docs.python.org/3.11/library/sys.html#sys.settrace
-        sys.settrace(self._dispatch_trace)
-        exec(compiled, _globals)
+        self._untraced_children = untraced_children
+        if remote:
+            from nanopdb.remote import RemoteConsole
+
+            self._remote = RemoteConsole(remote)
+        if commands:
+            from nanopdb.session import CommandSession
+
+            self._session = CommandSession(commands, self._canonic)
+            self._log_buffer.sink = self._session.log
+            self._is_first_call = False
+            self._session.preload(self)
+        if record or record_locals:
+            self._recorder = EventRecorder(snapshot_locals=record_locals)
+        if stats:
+            self.enable_stats(stats)
+        if profile:
+            # no tracer and no entrance break, `breakpoint()` still stops like in --lazy mode
+            self._lazy = True
+            self._is_first_call = False
+            from nanopdb.profiler import SamplingProfiler
+
+            self._profiler = SamplingProfiler(skip=self._is_debugger_frame)
+            self._profiler.start()
+        elif post_mortem:
+            self._lazy = True
+            self._is_first_call = False
+            self._post_mortem_enabled = True
+            self._previous_thread_excepthook = threading.excepthook
+            threading.excepthook = self._thread_excepthook
+        elif lazy:
+            self._lazy = True
+            self._is_first_call = False
+            signal.signal(attach_signal, self._on_attach_signal)
+        else:
+            self._install_tracing()
+        try:
+            exec(compiled, _globals)
+        except Exception as e:
+            if not self._post_mortem_enabled:
+                raise
+            import traceback
+
+            traceback.print_exception(e)
+            self._post_mortem(e)
+            # still end the program with an error, the traceback was shown already
+            raise SystemExit(1)
+        finally:
+            if profile:
+                self._profiler.stop()
+                print(self._profiler.report(), file=sys.stderr)
+                if profile_output:
+                    self._profiler.write_folded(profile_output)
@@ -0,0 +1,378 @@
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set
+import types
+
+from nanopdb.codecache import compile_script
+from nanopdb.nanopdb_v3 import CO_ASYNC, NanoPDB as NanoPDBV3, StepMode, StepState
+
+if not hasattr(sys, "monitoring"):
+    raise ImportError("NanoPDB V4 requires sys.monitoring (Python 3.12+)")
+
+# see https://docs.python.org/3.12/library/sys.monitoring.html
+monitoring = sys.monitoring
+events = monitoring.events
+DISABLE = monitoring.DISABLE
+TOOL_ID = monitoring.DEBUGGER_ID
+
+
+# NanoPDB V4: the same breakpoints, conditions and stepping as V3, but built on sys.monitoring (PEP 669).
+# Only code objects that contain a breakpoint get LINE events, every other location answers DISABLE,
+# and the per-frame events needed for stepping are only switched on while stepping.
+class NanoPDB(NanoPDBV3):
+    def __init__(self):
+        super().__init__()
+        # code objects that currently have LINE events for breakpoints
+        self._armed_codes: Set[types.CodeType] = set()
+        # thread ident -> its current single step, monitoring events are shared by all threads
+        self._active_steps: Dict[int, StepState] = {}
+        # code objects that have extra events turned on for the frames being stepped
+        self._stepping_codes: Set[types.CodeType] = set()
+        # code objects that handled an exception, with the events that tell whether it was caught, see
+        # `_on_exception_handled`
+        self._handling_codes: Set[types.CodeType] = set()
+
+    def _local_events_for(self, code: types.CodeType) -> int:
+        ev = events.NO_EVENTS
+        if code in self._armed_codes:
+            ev |= events.LINE
+        if code in self._stepping_codes:
+            ev |= events.LINE | events.PY_RETURN | events.PY_YIELD
+        if code in self._handling_codes:
+            ev |= events.LINE | events.PY_RETURN
+        return ev
+
+    def _set_local_events(self, code: types.CodeType):
+        monitoring.set_local_events(TOOL_ID, code, self._local_events_for(code))
+
+    def _arm(self, code: types.CodeType):
+        if code not in self._armed_codes:
+            self._armed_codes.add(code)
+            self._set_local_events(code)
+
+    def _update_global_events(self):
+        ev = events.NO_EVENTS
+        if self._function_breakpoints or any(
+            lines and file not in self._file_codes for file, lines in self._breakpoints_in_files.items()
+        ):
+            # code objects of files the import hook has not seen are checked once on their first start,
+            # then DISABLE'd; those of the files it has seen are armed directly, see `_resolve_module`
+            ev |= events.PY_START
+        if self._exception_breakpoints:
+            ev |= events.RAISE | events.EXCEPTION_HANDLED | events.RERAISE | events.PY_UNWIND
+        if self._return_breakpoints:
+            # returns of the other functions are DISABLE'd
+            ev |= events.PY_RETURN
+        if any(step.mode == StepMode.into for step in self._active_steps.values()):
+            ev |= events.LINE | events.PY_RETURN | events.PY_YIELD
+        if self._parked_by is not None:
+            # other threads park in `_on_line`
+            ev |= events.LINE
+        monitoring.set_events(TOOL_ID, ev)
+
+    def _arm_module(self, file: str):
+        for code in self._file_codes.get(file, ()):
+            if self._has_breakpoint_in(code):
+                self._arm(code)
+
+    def _resolve_module(self, file: str, code: types.CodeType) -> types.CodeType:
+        code = super()._resolve_module(file, code)
+        self._arm_module(file)
+        return code
+
+    def _rearm_breakpoints(self):
+        for code in list(self._armed_codes):
+            if not self._has_breakpoint_in(code):
+                self._armed_codes.discard(code)
+                self._set_local_events(code)
+        for file, lines in self._breakpoints_in_files.items():
+            if lines:
+                self._arm_module(file)
+        # code objects already running will not see PY_START again
+        frame = sys._getframe(1)
+        while frame:
+            if self._has_breakpoint_in(frame.f_code):
+                self._arm(frame.f_code)
+            frame = frame.f_back
+        self._update_global_events()
+        # re-deliver PY_START and LINE events that were DISABLE'd before this breakpoint existed
+        monitoring.restart_events()
+
+    def add_breakpoint(self, file: str, line: int, *args, **kwargs):
+        super().add_breakpoint(file, line, *args, **kwargs)
+        self._rearm_breakpoints()
+
+    def remove_breakpoint(self, file: str, line: int):
+        super().remove_breakpoint(file, line)
+        self._rearm_breakpoints()
+
+    def _event_breakpoints_changed(self):
+        super()._event_breakpoints_changed()
+        if not self._exception_breakpoints:
+            codes, self._handling_codes = self._handling_codes, set()
+            for code in codes:
+                self._set_local_events(code)
+        self._update_global_events()
+        # PY_START and PY_RETURN events of functions that now have a breakpoint may be DISABLE'd
+        monitoring.restart_events()
+
+    def _refresh_stepping(self):
+        codes = {
+            step.frame.f_code
+            for step in self._active_steps.values()
+            if step.mode != StepMode.into
+        }
+        changed = codes ^ self._stepping_codes
+        self._stepping_codes = codes
+        for code in changed:
+            self._set_local_events(code)
+        self._update_global_events()
+
+    def _park_threads(self):
+        super()._park_threads()
+        if self._parked_by is not None:
+            self._update_global_events()
+            monitoring.restart_events()
+
+    def _unpark_threads(self):
+        super()._unpark_threads()
+        self._update_global_events()
+
+    def _breakpoint(
+        self, frame: types.FrameType = None, reason: str = "breakpoint", *args, **kwargs
+    ):
+        if self._in_breakpoint:
+            return
+        frame = frame or sys._getframe(1)
+        # do not deliver the stepping events of this thread to the code run by the console
+        self._active_steps.pop(threading.get_ident(), None)
+        self._refresh_stepping()
+        super()._breakpoint(frame, reason, *args, **kwargs)
+        if self._single_step:
+            self._active_steps[threading.get_ident()] = self._single_step
+            self._refresh_stepping()
+            # lines of the stepped code may have been DISABLE'd by earlier events
+            monitoring.restart_events()
+
+    def _event_frame(self, code: types.CodeType) -> types.FrameType:
+        # the frame running `code` that an event is delivered for, callbacks may be wrapped (see `enable_stats`)
+        frame = sys._getframe(1)
+        while frame.f_code is not code:
+            frame = frame.f_back
+        return frame
+
+    def _on_py_start(self, code: types.CodeType, instruction_offset: int):
+        if self._has_breakpoint_in(code):
+            self._arm(code)
+        if self._function_breakpoints:
+            frame = self._event_frame(code)
+            if self._event_names(frame)[0] is not None:
+                if not self._in_breakpoint:
+                    self._stop_at_call(frame)
+                # keep the event for this function
+                return
+        return DISABLE
+
+    def _on_line(self, code: types.CodeType, line_number: int):
+        if self._parked_by is not None:
+            self._wait_if_parked()
+        if self._in_breakpoint:
+            return
+        frame = self._event_frame(code)
+
+        if frame in self._thread_state.unwinding and self._handle_caught(frame):
+            return
+
+        if self._is_first_call:
+            # break at entrance
+            self._is_first_call = False
+            self._breakpoint(frame, reason="start")
+            return
+
+        if self._single_step:
+            if self._single_step.mode != StepMode.out and self._is_stepped_into(
+                frame, self._single_step
+            ):
+                self._single_step = None
+                self._breakpoint(frame, reason="step")
+                return
+
+        if code in self._armed_codes and self._should_break_at(frame):
+            self._breakpoint(frame, reason="breakpoint")
+            return
+
+        if (
+            self._parked_by is None
+            and code not in self._armed_codes
+            and code not in self._stepping_codes
+            and self._is_filtered(frame)
+        ):
+            # stepping into skips library and event loop code, its lines come back with the next restart_events
+            return DISABLE
+
+        if not self._active_steps and self._parked_by is None and code not in self._handling_codes:
+            lines = self._breakpoints_in_files.get(self._code_file(code))
+            if not lines or line_number not in lines:
+                return DISABLE
+
+    # monitoring event -> name of the method that handles it
+    _CALLBACKS = {
+        "PY_START": "_on_py_start",
+        "LINE": "_on_line",
+        "PY_RETURN": "_on_py_return",
+        "PY_YIELD": "_on_py_yield",
+        "RAISE": "_on_raise",
+        "EXCEPTION_HANDLED": "_on_exception_handled",
+        "RERAISE": "_on_reraise",
+        "PY_UNWIND": "_on_py_unwind",
+    }
+
+    def _register_callbacks(self):
+        for event, name in self._CALLBACKS.items():
+            monitoring.register_callback(TOOL_ID, getattr(events, event), getattr(self, name))
+
+    def enable_stats(self, output: Optional[str] = None):
+        stats_enabled = self._stats is not None
+        super().enable_stats(output)
+        if stats_enabled:
+            return
+        for event, name in self._CALLBACKS.items():
+            setattr(self, name, self._stats.wrap_callback(getattr(self, name), event.lower()))
+        if monitoring.get_tool(TOOL_ID) == "nanopdb":
+            self._register_callbacks()
+
+    def _stop_at_return(self, frame: types.FrameType, retval) -> bool:
+        stopped = super()._stop_at_return(frame, retval)
+        if stopped and self._single_step:
+            # the step may have moved to the caller
+            self._refresh_stepping()
+        return stopped
+
+    def _after_fork_in_child(self):
+        super()._after_fork_in_child()
+        self._active_steps.clear()
+        self._refresh_stepping()
+
+    def _attach_child(self):
+        sys.breakpointhook = self._breakpoint
+        monitoring.use_tool_id(TOOL_ID, "nanopdb")
+        self._register_callbacks()
+        self._install_import_hook()
+        self._update_global_events()
+
+    def _on_raise(self, code: types.CodeType, instruction_offset: int, exc: BaseException):
+        # RAISE is delivered in every frame the exception goes through, its traceback starts where it was raised
+        if self._in_breakpoint:
+            return
+        frame = self._event_frame(code)
+        # like V3, which does not trace filtered frames
+        if not self._is_filtered(frame) and self._raised_here(exc.__traceback__):
+            self._stop_at_exception(frame, exc, "raised")
+
+    def _on_exception_handled(self, code: types.CodeType, instruction_offset: int, exc: BaseException):
+        # also delivered for `finally` bodies and the exits of `with`, which raise it again at their end:
+        # like V3, it is caught at the first line after the handler, or at a return, unless RERAISE or
+        # PY_UNWIND come first
+        if self._in_breakpoint:
+            return
+        frame = self._event_frame(code)
+        if self._is_filtered(frame):
+            return
+        self._thread_state.unwinding[frame] = exc
+        if code not in self._handling_codes:
+            # its LINE and PY_RETURN events stay on, and are not DISABLE'd, while there are exception breakpoints
+            self._handling_codes.add(code)
+            self._set_local_events(code)
+            # the lines after the handler may have been DISABLE'd
+            monitoring.restart_events()
+
+    def _handle_caught(self, frame: types.FrameType) -> bool:
+        exc = self._thread_state.unwinding[frame]
+        if self._is_handling(frame, exc):
+            return False
+        del self._thread_state.unwinding[frame]
+        return self._stop_at_exception(frame, exc, "caught")
+
+    def _on_reraise(self, code: types.CodeType, instruction_offset: int, exc: BaseException):
+        # the end of a `finally` body or of the exit of a `with`, or a bare `raise`: not caught (yet)
+        self._thread_state.unwinding.pop(self._event_frame(code), None)
+
+    def _on_py_unwind(self, code: types.CodeType, instruction_offset: int, exc: BaseException):
+        frame = self._event_frame(code)
+        self._thread_state.unwinding.pop(frame, None)
+        if not self._in_breakpoint and self._is_outermost_frame(frame):
+            self._stop_at_exception(frame, exc, "uncaught")
+
+    def _on_py_return(self, code: types.CodeType, instruction_offset: int, retval):
+        if code in self._handling_codes and not self._in_breakpoint:
+            frame = self._event_frame(code)
+            exc = self._thread_state.unwinding.pop(frame, None)
+            if exc is not None:
+                # e.g. a `return` in its handler, or in a `finally` body
+                self._stop_at_exception(frame, exc, "caught")
+        if self._return_breakpoints and not self._in_breakpoint:
+            frame = self._event_frame(code)
+            if self._event_names(frame)[1] is not None:
+                self._stop_at_return(frame, retval)
+                # keep the event for this function
+                return
+        if code in self._handling_codes:
+            # other frames of `code` may handle an exception too
+            return
+        return self._leave_frame(code)
+
+    def _on_py_yield(self, code: types.CodeType, instruction_offset: int, value):
+        if code.co_flags & CO_ASYNC:
+            # an `await` suspends the coroutine, the event loop resumes the same frame later
+            return None if self._active_steps else DISABLE
+        return self._leave_frame(code)
+
+    def _leave_frame(self, code: types.CodeType):
+        # the frame running `code` is returning or yielding, which ends a step over or out of it
+        if self._in_breakpoint:
+            return
+        if not self._active_steps:
+            return DISABLE
+        if not self._single_step:
+            # another thread is stepping
+            return
+        frame = self._event_frame(code)
+        if self._single_step.mode != StepMode.into and frame is not self._single_step.frame:
+            return
+        back = self._unfiltered_caller(frame)
+        if back is not None and back is frame.f_back:
+            self._single_step.frame = back
+            self._breakpoint(back, reason="step")
+        elif code.co_flags & CO_ASYNC:
+            # the coroutine of a task returns to the event loop, stop at the next line run outside of it
+            self._single_step.mode = StepMode.into
+            self._refresh_stepping()
+            monitoring.restart_events()
+        elif back is not None:
+            # returning into filtered frames, step over them until the code above them runs again
+            self._single_step.frame = back
+            if self._single_step.mode == StepMode.out:
+                self._single_step.mode = StepMode.over
+            self._refresh_stepping()
+            monitoring.restart_events()
+
+    def run(self, _globals):
+        file = Path(sys.argv[0])
+        self._main_file = file.name
+        self._main_path = sys.intern(os.path.realpath(file))
+        compiled = compile_script(file)
+        sys.breakpointhook = self._breakpoint
+
+        monitoring.use_tool_id(TOOL_ID, "nanopdb")
+        try:
+            self._register_callbacks()
+            compiled = self._resolve_module(self._main_path, compiled)
+            self._install_import_hook()
+            # the first line of the module is the entrance break, like the first `call` event in V3
+            monitoring.set_local_events(TOOL_ID, compiled, events.LINE)
+            exec(compiled, _globals)
+        finally:
+            monitoring.set_events(TOOL_ID, events.NO_EVENTS)
+            monitoring.free_tool_id(TOOL_ID)
@@ -0,0 +1,247 @@
+import __future__
+import ast
+import builtins
+import gc
+import os
+import sys
+import weakref
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+import types
+
+from nanopdb.codecache import compile_script
+from nanopdb.nanopdb_v3 import NanoPDB as NanoPDBV3
+
+# name of the hook injected in front of every statement that starts on a breakpoint line
+HOOK_NAME = "__nanopdb_hook__"
+
+
+class BreakpointInstrumenter(ast.NodeTransformer):
+    """insert `__nanopdb_hook__()` in front of the first statement starting on each of `lines`"""
+
+    def __init__(self, lines: Set[int]):
+        self.lines = lines
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        super().generic_visit(node)
+        for field in ("body", "orelse", "finalbody"):
+            stmts = getattr(node, field, None)
+            if isinstance(stmts, list) and stmts and isinstance(stmts[0], ast.stmt):
+                setattr(node, field, self._instrument(stmts))
+        return node
+
+    def _instrument(self, stmts):
+        instrumented = []
+        for stmt in stmts:
+            if stmt.lineno in self.lines:
+                hook = ast.Expr(ast.Call(ast.Name(HOOK_NAME, ast.Load()), [], []))
+                # keep the hook on the breakpoint line, so that `frame.f_lineno` matches it
+                for node in ast.walk(hook):
+                    node.lineno = node.end_lineno = stmt.lineno
+                    node.col_offset = node.end_col_offset = stmt.col_offset
+                instrumented.append(hook)
+            instrumented.append(stmt)
+        return instrumented
+
+
+def _has_hook(code: types.CodeType) -> bool:
+    return HOOK_NAME in code.co_names or any(
+        isinstance(c, types.CodeType) and _has_hook(c) for c in code.co_consts
+    )
+
+
+def _collect_codes(
+    code: types.CodeType, codes: Dict[Tuple[str, int], types.CodeType]
+) -> Dict[Tuple[str, int], types.CodeType]:
+    codes[(code.co_qualname, code.co_firstlineno)] = code
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            _collect_codes(c, codes)
+    return codes
+
+
+# NanoPDB V5: breakpoints without any tracer. Setting a breakpoint recompiles the file with a hook call in
+# front of the breakpoint line and swaps `__code__` of the affected functions, everything else runs natively.
+# A trace function is only installed while single stepping.
+class NanoPDB(NanoPDBV3):
+    def __init__(self):
+        super().__init__()
+        self._main_source: Optional[str] = None
+        # function -> the code object it had before it was instrumented
+        self._original_codes: "weakref.WeakKeyDictionary[types.FunctionType, types.CodeType]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _compile_instrumented(
+        self, source: str, filename: str, lines: Set[int]
+    ) -> types.CodeType:
+        tree = BreakpointInstrumenter(lines).visit(ast.parse(source, filename))
+        return compile(tree, filename, "exec", dont_inherit=True)
+
+    def _read_source(self, file: str) -> Optional[str]:
+        if file == self._main_path and self._main_source is not None:
+            return self._main_source
+        try:
+            return Path(file).read_text()
+        except OSError:
+            return None
+
+    def _instrument_file(self, file: str):
+        lines = self._breakpoints_in_files.get(file, set())
+        functions = [
+            f
+            for f in gc.get_objects()
+            if isinstance(f, types.FunctionType)
+            and self._code_file(self._original_codes.get(f, f.__code__)) == file
+        ]
+        if not functions:
+            return
+        source = self._read_source(file)
+        if source is None:
+            print(f"Cannot read the source of {file}, breakpoints there are not instrumented")
+            return
+
+        # compiled lazily, at most once per (instrumented, plain) flavour
+        compiled: Dict[bool, Dict[Tuple[str, int], types.CodeType]] = {}
+
+        def codes(instrumented: bool) -> Dict[Tuple[str, int], types.CodeType]:
+            if instrumented not in compiled:
+                filename = functions[0].__code__.co_filename
+                module = self._compile_instrumented(
+                    source, filename, lines if instrumented else set()
+                )
+                compiled[instrumented] = _collect_codes(module, {})
+            return compiled[instrumented]
+
+        for f in functions:
+            code = f.__code__
+            key = (code.co_qualname, code.co_firstlineno)
+            first, last = self._code_line_range(code)
+            if any(first <= line <= last for line in lines):
+                if f not in self._original_codes:
+                    # a function defined by already instrumented code has no plain code object yet
+                    self._original_codes[f] = code if not _has_hook(code) else codes(False)[key]
+                new_code = codes(True).get(key)
+                if new_code is not None:
+                    f.__globals__[HOOK_NAME] = self._hook
+                    f.__code__ = new_code
+            elif f in self._original_codes:
+                f.__code__ = self._original_codes.pop(f)
+            elif _has_hook(code):
+                f.__code__ = codes(False).get(key, code)
+
+    def _resolve_module(self, file: str, code: types.CodeType) -> types.CodeType:
+        code = super()._resolve_module(file, code)
+        lines = self._breakpoints_in_files.get(file)
+        if not lines or file == self._main_path:
+            return code
+        source = self._read_source(file)
+        if source is None:
+            print(f"Cannot read the source of {file}, breakpoints there are not instrumented")
+            return code
+        # the module runs instrumented, so its functions are defined with the hooks already; the module's
+        # globals do not exist yet, the hook is found in the builtins instead
+        setattr(builtins, HOOK_NAME, self._hook)
+        return self._compile_instrumented(source, code.co_filename, lines)
+
+    def add_breakpoint(self, file: str, line: int, *args, **kwargs):
+        super().add_breakpoint(file, line, *args, **kwargs)
+        self._instrument_file(self._canonic(file))
+
+    def remove_breakpoint(self, file: str, line: int):
+        super().remove_breakpoint(file, line)
+        self._instrument_file(self._canonic(file))
+
+    def _hook(self):
+        frame = sys._getframe(1)
+        if self._is_first_call:
+            # break at entrance
+            self._is_first_call = False
+            self._breakpoint(frame, reason="start")
+        elif self._should_break_at(frame):
+            self._breakpoint(frame, reason="breakpoint")
+
+    def _attach_child(self):
+        sys.breakpointhook = self._breakpoint
+        self._install_import_hook()
+        setattr(builtins, HOOK_NAME, self._hook)
+
+    def _child_main_loaded(self):
+        # the functions of `__mp_main__` were defined without hooks
+        for file in list(self._breakpoints_in_files):
+            self._instrument_file(file)
+
+    def _handle_line(self, frame: types.FrameType):
+        # line breakpoints are served by the injected hooks, tracing is only used for stepping
+        pass
+
+    def _event_breakpoints_changed(self):
+        super()._event_breakpoints_changed()
+        # function, exception and return breakpoints are served by the tracer, see `_dispatch_events`
+        if self._has_event_breakpoints:
+            self._install_tracing()
+        elif not self._stepping_threads:
+            self._remove_tracing()
+
+    def _default_dispatch(self, frame: types.FrameType, event: str, arg):
+        if event != "call":
+            return
+        if not self._stepping_threads or not self._single_step:
+            if self._has_event_breakpoints:
+                return self._dispatch_events(frame)
+            return
+        step = self._single_step
+        if (
+            frame.f_code.co_name == "<module>"
+            and step.frame.f_code.co_name == "<module>"
+            and frame.f_back
+            and self._is_debugger_frame(frame.f_back)
+        ):
+            # stepping over a top-level statement continues in the next statement run by `run`
+            step.frame = frame
+        if self._has_event_breakpoints:
+            return self._dispatch_events(frame)
+        if self._is_stepped_into(frame, step):
+            return self._dispatch_trace
+
+    def _breakpoint(
+        self, frame: types.FrameType = None, reason: str = "breakpoint", *args, **kwargs
+    ):
+        if self._in_breakpoint:
+            return
+        frame = frame or sys._getframe(1)
+        # the console itself must not be traced
+        sys.settrace(None)
+        super()._breakpoint(frame, reason, *args, **kwargs)
+        if self._single_step or self._has_event_breakpoints:
+            sys.settrace(self._dispatch_trace)
+        if self._single_step:
+            self._single_step.frame.f_trace = self._dispatch_trace
+
+    def run(self, _globals):
+        file = Path(sys.argv[0])
+        self._main_file = file.name
+        self._main_path = sys.intern(os.path.realpath(file))
+        self._main_source = file.read_text()
+        sys.breakpointhook = self._breakpoint
+        _globals[HOOK_NAME] = self._hook
+
+        # compile and run the script one top-level statement at a time, so that functions defined
+        # after the entrance break already get the breakpoints set there
+        tree = ast.parse(self._main_source, file.name)
+        self._resolve_module(self._main_path, compile_script(file, self._main_source))
+        self._install_import_hook()
+        first_line = tree.body[0].lineno if tree.body else 1
+        # the entrance break is a hook on an empty statement in front of the script
+        start = ast.Pass(lineno=first_line, col_offset=0, end_lineno=first_line, end_col_offset=0)
+        flags = 0
+        for stmt in [start] + tree.body:
+            lines = self._breakpoints_in_files.get(self._main_path, set())
+            if stmt is start:
+                lines = {first_line}
+            module = BreakpointInstrumenter(lines).visit(ast.Module([stmt], []))
+            compiled = compile(module, file.name, "exec", flags=flags, dont_inherit=True)
+            exec(compiled, _globals)
+            if isinstance(stmt, ast.ImportFrom) and stmt.module == "__future__":
+                for alias in stmt.names:
+                    flags |= getattr(__future__, alias.name).compiler_flag
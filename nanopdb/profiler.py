@@ -0,0 +1,100 @@
+import os
+import signal
+import sys
+import threading
+import types
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def _name(code: types.CodeType) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    samples the stacks of all threads every `interval` seconds of CPU time (SIGPROF), without any tracer.
+    A sample is the tuple of code objects of a stack, outermost first, and frames for which `skip` is
+    true are left out, e.g. the debugger's own. Only the main thread can handle the signal.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.005,
+        skip: Optional[Callable[[types.FrameType], bool]] = None,
+    ):
+        if not hasattr(signal, "setitimer"):
+            raise RuntimeError("sampling needs signal.setitimer, which this platform lacks")
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._skip = skip
+        # code object -> whether its frames are skipped, `skip` is only asked once per code object
+        self._skipped: Dict[types.CodeType, bool] = {}
+        self._previous_handler = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        self.running = False
+
+    def _is_skipped(self, frame: types.FrameType) -> bool:
+        skipped = self._skipped.get(frame.f_code)
+        if skipped is None:
+            skipped = self._skipped[frame.f_code] = bool(self._skip and self._skip(frame))
+        return skipped
+
+    def _sample(self, signum: int, interrupted: types.FrameType):
+        main = threading.main_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == main:
+                # the main thread's top frame is this handler, start from the frame it interrupted
+                frame = interrupted
+            stack = []
+            while frame:
+                if not self._is_skipped(frame):
+                    stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.samples[tuple(stack)] += 1
+
+    def folded(self) -> List[str]:
+        """one `outer;...;inner count` line per distinct stack, the input of flamegraph.pl and speedscope"""
+        return [
+            f"{';'.join(_name(code) for code in stack)} {count}"
+            for stack, count in self.samples.most_common()
+        ]
+
+    def write_folded(self, path: str):
+        with open(path, "w") as f:
+            for line in self.folded():
+                f.write(line + "\n")
+
+    def top(self, n: int = 20) -> List[Tuple[str, int, int]]:
+        """(function, samples on top of the stack, samples anywhere in the stack) of the n busiest functions"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for code in set(stack):
+                total[code] += count
+        return [(_name(code), own[code], count) for code, count in total.most_common(n)]
+
+    def report(self, n: int = 20) -> str:
+        samples = sum(self.samples.values())
+        if not samples:
+            return "No samples"
+        lines = [f"{samples} samples every {self.interval * 1000:g}ms of CPU time", f"{'self':>7} {'total':>7}  function"]
+        for name, own, total in self.top(n):
+            lines.append(f"{own / samples:7.1%} {total / samples:7.1%}  {name}")
+        return "\n".join(lines)
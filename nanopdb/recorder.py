@@ -0,0 +1,86 @@
+import linecache
+import types
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+EVENTS = ("call", "line", "return", "exception")
+EVENT_CODES = {event: i for i, event in enumerate(EVENTS)}
+LINE = EVENT_CODES["line"]
+
+# types whose values are cheap and safe to keep from a frame's locals
+_SCALARS = (int, float, bool, complex, type(None))
+_MAX_STR = 80
+
+
+def scalar_locals(frame: types.FrameType) -> Dict[str, object]:
+    return {
+        name: value
+        for name, value in frame.f_locals.items()
+        if type(value) in _SCALARS or (type(value) is str and len(value) <= _MAX_STR)
+    }
+
+
+class EventRecorder:
+    """
+    fixed-size ring buffer of trace events. Every event is an entry in each of a few parallel arrays
+    (code object index, line, frame depth, event type), so recording allocates no Python object per event.
+    With `snapshot_locals`, line events also keep a dict of the scalar locals of the frame.
+    """
+
+    def __init__(self, capacity: int = 100000, snapshot_locals: bool = False):
+        self.capacity = capacity
+        # code objects are stored once and referred to by their index
+        self._codes: List[types.CodeType] = []
+        self._code_ids: Dict[types.CodeType, int] = {}
+        self._code_index = array("I", [0]) * capacity
+        self._lines = array("i", [0]) * capacity
+        self._depths = array("i", [0]) * capacity
+        self._events = array("B", [0]) * capacity
+        self._locals: Optional[list] = [None] * capacity if snapshot_locals else None
+        # number of events recorded so far, the next one goes to `_count % capacity`
+        self._count = 0
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def record(self, frame: types.FrameType, event: int, depth: int):
+        code = frame.f_code
+        code_id = self._code_ids.get(code)
+        if code_id is None:
+            code_id = self._code_ids[code] = len(self._codes)
+            self._codes.append(code)
+        i = self._count % self.capacity
+        self._code_index[i] = code_id
+        self._lines[i] = frame.f_lineno or 0
+        self._depths[i] = depth
+        self._events[i] = event
+        if self._locals is not None:
+            self._locals[i] = scalar_locals(frame) if event == LINE else None
+        self._count += 1
+
+    def event(self, age: int) -> Tuple[str, types.CodeType, int, int, Optional[dict]]:
+        """(event, code, line, depth, scalar locals) of the event `age` events ago, 0 is the latest"""
+        if not 0 <= age < len(self):
+            raise IndexError(f"only {len(self)} events are recorded")
+        i = (self._count - 1 - age) % self.capacity
+        snapshot = self._locals[i] if self._locals is not None else None
+        return (
+            EVENTS[self._events[i]],
+            self._codes[self._code_index[i]],
+            self._lines[i],
+            self._depths[i],
+            snapshot,
+        )
+
+    def line_ages(self) -> List[int]:
+        """ages of the recorded line events, latest first"""
+        return [age for age in range(len(self)) if self._events[(self._count - 1 - age) % self.capacity] == LINE]
+
+    def describe(self, age: int, source: bool = False) -> str:
+        event, code, line, depth, snapshot = self.event(age)
+        text = f"#{age:<6} {'  ' * max(depth, 0)}{event:9} {code.co_filename}:{line} ({code.co_name})"
+        if source:
+            text += f"  {linecache.getline(code.co_filename, line).strip()}"
+        if snapshot:
+            text += f"  {snapshot}"
+        return text
@@ -0,0 +1,132 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from code import InteractiveConsole
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from typing import Tuple, Union
+
+from nanopdb.values import display
+
+# replies are cut to this many characters, so that printing a huge object does not flood the connection
+MAX_OUTPUT = 1 << 16
+
+
+def parse_address(address: str) -> Tuple[int, Union[str, Tuple[str, int]]]:
+    """"host:port" is a TCP address, anything else the path of a Unix socket"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def encode(message: dict) -> bytes:
+    # one compact JSON object per line, json escapes the newlines inside strings
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode(line: bytes) -> dict:
+    return json.loads(line)
+
+
+def _cut(text: str) -> str:
+    if len(text) <= MAX_OUTPUT:
+        return text
+    return text[:MAX_OUTPUT] + f"\n... ({len(text) - MAX_OUTPUT} more characters)\n"
+
+
+class RemoteConsole:
+    """
+    the console of a debuggee process served to `python -m nanopdb.client` listening on `address`.
+    The process connects on its first stop and keeps the connection, its threads stop one at a time.
+    Every stop is a `stop` message, then the client sends the console input line by line (`push`) and
+    gets the output back (`reply`), until a line continues the program.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self._socket = None
+        self._file = None
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def after_fork(self):
+        # the connection belongs to the parent, closing the child's descriptor leaves it open, and the child
+        # says hello on its own connection
+        self._close()
+
+    def _connect(self):
+        family, address = parse_address(self.address)
+        waiting = False
+        while True:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(address)
+                break
+            except OSError:
+                sock.close()
+                if not waiting:
+                    print(f"nanopdb: waiting for a client at {self.address}", file=sys.stderr)
+                    waiting = True
+                time.sleep(1)
+        self._socket = sock
+        self._file = sock.makefile("rwb")
+        self._send({"event": "hello", "pid": os.getpid(), "argv": sys.argv})
+
+    def _send(self, message: dict):
+        self._file.write(encode(message))
+        self._file.flush()
+
+    def _receive(self) -> dict:
+        line = self._file.readline()
+        if not line:
+            raise OSError("the client is gone")
+        return decode(line)
+
+    def interact(self, console: InteractiveConsole, message: str):
+        """serve the console until a line continues the program, reconnecting if the client goes away"""
+        stop = {
+            "event": "stop",
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "message": message,
+        }
+        while True:
+            try:
+                if self._file is None:
+                    self._connect()
+                self._send(stop)
+                while True:
+                    request = self._receive()
+                    self._run(console, request)
+            except OSError:
+                self._close()
+
+    def _run(self, console: InteractiveConsole, request: dict):
+        output = StringIO()
+        displayhook = sys.displayhook
+        sys.displayhook = display
+        reply = {"event": "reply", "id": request["id"]}
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                reply["more"] = console.push(request["line"])
+        except SystemExit:
+            # the line continues the program, which must not wait for a client that is gone
+            reply["output"] = _cut(output.getvalue())
+            reply["running"] = True
+            try:
+                self._send(reply)
+            except OSError:
+                pass
+            raise
+        finally:
+            sys.displayhook = displayhook
+        reply["output"] = _cut(output.getvalue())
+        self._send(reply)
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+import threading
+from code import InteractiveConsole
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from nanopdb.remote import encode
+from nanopdb.values import short_repr
+
+Action = Union[str, Dict[str, str]]
+
+# actions that leave the stop, as the console lines that do it
+_RESUME = {
+    "cont": "cont()",
+    "step": "step()",
+    "step_into": "step(into=True)",
+    "step_out": "step_out()",
+    "detach": "detach()",
+    "exit": "exit()",
+}
+
+
+def _resumes(action: Action) -> bool:
+    return isinstance(action, str) and action in _RESUME
+
+
+class CommandSession:
+    """
+    a console without a person at it, for `python -m nanopdb --commands FILE`: FILE is a JSON object like
+
+        {
+            "output": "session.jsonl",
+            "breakpoints": [
+                {"file": "fib.py", "line": 9, "condition": "n == 2", "actions": [{"eval": "f1 + f2"}, "cont"]},
+                {"file": "fib.py", "line": 5, "log": "n={n}"},
+                {"function": "fib", "condition": "n == 0"},
+                {"exception": "ValueError", "when": "uncaught"},
+                {"return": "fib", "condition": "retval > 10"}
+            ],
+            "actions": ["where", "locals", "cont"],
+            "max_stops": 1000
+        }
+
+    The breakpoint entries take the arguments of `add_breakpoint`, `add_function_breakpoint`,
+    `add_exception_breakpoint` and `add_return_breakpoint`. Every stop runs the actions of its line breakpoint,
+    or else the default `actions`: "where", "locals", {"eval": expression}, {"exec": statements}, and at last
+    one of "cont" (the default), "step", "step_into", "step_out", "detach" or "exit". After `max_stops` stops
+    the debugger detaches. Each stop, logpoint message and breakpoint set is written to `output` (default:
+    stdout) as one JSON line, appended by child processes.
+    """
+
+    def __init__(self, path: str, canonic: Callable[[str], str], child: bool = False):
+        self.path = path
+        with open(path) as f:
+            spec = json.load(f)
+        self.breakpoints: List[dict] = spec.get("breakpoints", [])
+        self.actions: List[Action] = spec.get("actions", ["cont"])
+        self.max_stops: Optional[int] = spec.get("max_stops")
+        self.stops = 0
+        # (canonical file, line) -> the actions of that breakpoint
+        self._line_actions: Dict[Tuple[str, int], List[Action]] = {
+            (canonic(b["file"]), b["line"]): b["actions"]
+            for b in self.breakpoints
+            if "file" in b and "actions" in b
+        }
+        self._canonic = canonic
+        output = spec.get("output")
+        self._output = open(output, "a" if child else "w") if output else sys.stdout
+        self._lock = threading.Lock()
+
+    def _write(self, record: dict):
+        record["pid"] = os.getpid()
+        # one write per line, so that lines of processes appending to the same file do not mix
+        with self._lock:
+            self._output.write(encode(record).decode())
+            self._output.flush()
+
+    def preload(self, debugger):
+        """set the breakpoints of the session file in `debugger`"""
+        for b in self.breakpoints:
+            output = StringIO()
+            with redirect_stdout(output):
+                if "file" in b:
+                    debugger.add_breakpoint(
+                        b["file"],
+                        b["line"],
+                        b.get("condition"),
+                        b.get("ignore", 0),
+                        b.get("temporary", False),
+                        b.get("log"),
+                    )
+                elif "function" in b:
+                    debugger.add_function_breakpoint(b["function"], b.get("condition"))
+                elif "exception" in b:
+                    debugger.add_exception_breakpoint(b["exception"], b.get("when", "raised"))
+                elif "return" in b:
+                    debugger.add_return_breakpoint(b["return"], b.get("condition"))
+                else:
+                    print(f"Unknown breakpoint {b!r}")
+            self._write({"event": "breakpoint", "message": output.getvalue().strip()})
+
+    def log(self, messages: List[str]):
+        """a `LogBuffer` sink"""
+        for message in messages:
+            self._write({"event": "log", "message": message})
+
+    def interact(self, console: InteractiveConsole, message: str):
+        """run the actions of this stop, the last one raises SystemExit to leave the console"""
+        self.stops += 1
+        record = {"event": "stop", "thread": threading.current_thread().name, "message": message}
+        namespace = console.locals
+        frame = getattr(namespace, "frame", None)
+        actions = self.actions
+        if frame is not None:
+            record.update(
+                file=frame.f_code.co_filename, line=frame.f_lineno, function=frame.f_code.co_name
+            )
+            key = (self._canonic(frame.f_code.co_filename), frame.f_lineno)
+            actions = self._line_actions.get(key, actions)
+        if self.max_stops is not None and self.stops >= self.max_stops:
+            record["limit"] = self.max_stops
+            actions = [a for a in actions if not _resumes(a)] + ["detach"]
+        record["results"] = results = []
+        try:
+            for action in actions:
+                if _resumes(action):
+                    results.append({"resume": action})
+                    self._push(console, _RESUME[action])
+                results.append(self._run(console, action))
+            self._push(console, _RESUME["cont"])
+        finally:
+            # written while SystemExit goes up to continue the program
+            self._write(record)
+
+    def _push(self, console: InteractiveConsole, source: str) -> str:
+        output = StringIO()
+        with redirect_stdout(output), redirect_stderr(output):
+            try:
+                for line in source.splitlines():
+                    console.push(line)
+                # close an indented block
+                console.push("")
+            finally:
+                console.resetbuffer()
+        return output.getvalue()
+
+    def _run(self, console: InteractiveConsole, action: Action) -> dict:
+        globals_ = getattr(console, "globals", console.locals)
+        if action == "locals":
+            frame = getattr(console.locals, "frame", None)
+            values = frame.f_locals if frame is not None else console.locals
+            return {"locals": {name: short_repr(value) for name, value in values.items()}}
+        if action == "where":
+            return {"where": self._push(console, "where()")}
+        if isinstance(action, dict) and "eval" in action:
+            try:
+                value = eval(action["eval"], globals_, console.locals)
+                return {"eval": action["eval"], "value": short_repr(value)}
+            except Exception as e:
+                return {"eval": action["eval"], "error": f"{type(e).__name__}: {e}"}
+        if isinstance(action, dict) and "exec" in action:
+            return {"exec": action["exec"], "output": self._push(console, action["exec"])}
+        return {"error": f"unknown action {action!r}"}
@@ -0,0 +1,133 @@
+import json
+import types
+from collections import Counter
+from time import perf_counter
+from typing import Callable, Dict
+
+
+def _code_name(code: types.CodeType) -> str:
+    return f"{code.co_filename}:{code.co_firstlineno} ({code.co_name})"
+
+
+class TracerStats:
+    """
+    counts the events the debugger handles, by type and by code object, and the time spent in the
+    tracer, in breakpoint conditions and in the console. The time in the tracer excludes the console.
+    Nothing is measured until the debugger wraps its functions with `wrap_*`, see `NanoPDB.enable_stats`.
+    """
+
+    def __init__(self):
+        self.events: Counter = Counter()
+        self.code_events: Counter = Counter()
+        self.tracer_seconds = 0.0
+        self.console_seconds = 0.0
+        # condition location -> seconds spent evaluating it
+        self.condition_seconds: Dict[str, float] = {}
+        self.condition_evaluations: Counter = Counter()
+
+    def wrap_trace_function(self, trace: Callable) -> Callable:
+        """wrap a sys.settrace function, `trace` must return the wrapper itself to keep counting"""
+
+        def timed_trace(frame: types.FrameType, event: str, arg):
+            console = self.console_seconds
+            start = perf_counter()
+            try:
+                return trace(frame, event, arg)
+            finally:
+                self.tracer_seconds += perf_counter() - start - (self.console_seconds - console)
+                self.events[event] += 1
+                self.code_events[frame.f_code] += 1
+
+        return timed_trace
+
+    def wrap_callback(self, callback: Callable, event: str) -> Callable:
+        """wrap a sys.monitoring callback, which gets the code object first"""
+
+        def timed_callback(code: types.CodeType, *args):
+            console = self.console_seconds
+            start = perf_counter()
+            try:
+                return callback(code, *args)
+            finally:
+                self.tracer_seconds += perf_counter() - start - (self.console_seconds - console)
+                self.events[event] += 1
+                self.code_events[code] += 1
+
+        return timed_callback
+
+    def wrap_condition(self, eval_condition: Callable) -> Callable:
+        def timed_condition(condition, frame: types.FrameType, location: str, *args):
+            start = perf_counter()
+            try:
+                return eval_condition(condition, frame, location, *args)
+            finally:
+                self.condition_seconds[location] = (
+                    self.condition_seconds.get(location, 0.0) + perf_counter() - start
+                )
+                self.condition_evaluations[location] += 1
+
+        return timed_condition
+
+    def wrap_console(self, console: Callable) -> Callable:
+        def timed_console(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return console(*args, **kwargs)
+            finally:
+                self.console_seconds += perf_counter() - start
+
+        return timed_console
+
+    def file_events(self) -> Counter:
+        files: Counter = Counter()
+        # list() copies without running Python code, which the tracer could count into the dict meanwhile
+        for code, count in list(self.code_events.items()):
+            files[code.co_filename] += count
+        return files
+
+    def report(self, n: int = 10) -> str:
+        conditions = sum(self.condition_seconds.values())
+        lines = [
+            f"{sum(self.events.values())} events: "
+            + ", ".join(f"{event} {count}" for event, count in self.events.most_common()),
+            f"tracer {self.tracer_seconds:.3f}s (conditions {conditions:.3f}s), console {self.console_seconds:.3f}s",
+            "busiest files:",
+        ]
+        lines += [f"{count:>10}  {file}" for file, count in self.file_events().most_common(n)]
+        lines.append("busiest functions:")
+        lines += [f"{count:>10}  {_code_name(code)}" for code, count in self.code_events.most_common(n)]
+        if self.condition_seconds:
+            lines.append("slowest conditions:")
+            slowest = sorted(self.condition_seconds.items(), key=lambda item: -item[1])[:n]
+            lines += [
+                f"{seconds:>9.3f}s  {location} ({self.condition_evaluations[location]} evaluations)"
+                for location, seconds in slowest
+            ]
+        return "\n".join(lines)
+
+    def to_json(self) -> dict:
+        return {
+            "events": dict(list(self.events.items())),
+            "seconds": {
+                "tracer": round(self.tracer_seconds, 6),
+                "conditions": round(sum(self.condition_seconds.values()), 6),
+                "console": round(self.console_seconds, 6),
+            },
+            "files": dict(self.file_events().most_common()),
+            "functions": {
+                _code_name(code): count
+                for code, count in sorted(list(self.code_events.items()), key=lambda item: -item[1])
+            },
+            "conditions": {
+                location: {
+                    "seconds": round(seconds, 6),
+                    "evaluations": self.condition_evaluations[location],
+                }
+                for location, seconds in list(self.condition_seconds.items())
+            },
+        }
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+            f.write("\n")
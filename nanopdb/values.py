@@ -0,0 +1,237 @@
+import builtins
+import reprlib
+import sys
+import time
+from collections.abc import Mapping
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+
+# how long a `short_repr` may take, and `show` on the reprs of one page
+TIME_BUDGET = 0.5
+# characters of a `short_repr`, whatever the number and depth of the items
+_MAX_CHARS = 4000
+# characters of a string or bytes value on one page of `show`
+_CHARS_PER_ITEM = 64
+
+_CONTAINERS = (list, tuple, dict, set, frozenset, str, bytes, bytearray)
+
+
+class BoundedRepr(reprlib.Repr):
+    """
+    a reprlib.Repr that never builds the whole repr of a builtin container, of a subclass of one, of bytes or
+    of a huge int, whatever their size. Other objects still make their own repr, which reprlib then cuts.
+    The limits of reprlib apply at every level, so a repr also stops once it has `maxtotal` characters or
+    took `budget` seconds, the items left show as "...".
+    """
+
+    def __init__(self, maxtotal: int = _MAX_CHARS, budget: float = TIME_BUDGET):
+        super().__init__()
+        self.maxstring = self.maxother = 200
+        self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = self.maxdict = 50
+        self.maxlevel = 3
+        self.maxtotal = maxtotal
+        self.budget = budget
+        # characters left and end of the time budget of the repr being made
+        self._remaining = maxtotal
+        self._deadline = float("inf")
+
+    def repr(self, x) -> str:
+        self._remaining = self.maxtotal
+        self._deadline = time.perf_counter() + self.budget
+        s = super().repr(x)
+        # the "..." of the items left and the separators can still go beyond
+        return s if len(s) <= self.maxtotal else s[: self.maxtotal - 3] + "..."
+
+    def repr1(self, x, level: int) -> str:
+        if self._remaining <= 0 or time.perf_counter() > self._deadline:
+            return "..."
+        remaining = self._remaining
+        s = self._repr1(x, level)
+        if self._remaining == remaining:
+            # containers are charged for their items
+            self._remaining -= len(s)
+        return s
+
+    def _repr1(self, x, level: int) -> str:
+        if not hasattr(self, "repr_" + type(x).__name__.replace(" ", "_")):
+            # a big subclass of a builtin container, e.g. a 10M element list subclass, is cut like the builtin,
+            # small ones keep their own repr
+            for base in _CONTAINERS:
+                if isinstance(x, base) and (len(x) > self.maxlist or type(x).__repr__ is base.__repr__):
+                    return getattr(self, "repr_" + base.__name__)(x, level)
+        return super().repr1(x, level)
+
+    # reprlib sorts all the items of sets and dicts before taking the first ones, these take them in order
+
+    def repr_set(self, x: set, level: int) -> str:
+        return self._repr_iterable(x, level, "{", "}", self.maxset) if x else "set()"
+
+    def repr_frozenset(self, x: frozenset, level: int) -> str:
+        return self._repr_iterable(x, level, "frozenset({", "})", self.maxfrozenset) if x else "frozenset()"
+
+    def repr_dict(self, x: dict, level: int) -> str:
+        if not x:
+            return "{}"
+        if level <= 0:
+            return "{" + self.fillvalue + "}"
+        pieces = [
+            f"{self.repr1(key, level - 1)}: {self.repr1(value, level - 1)}"
+            for key, value in islice(dict.items(x), self.maxdict)
+        ]
+        if len(x) > self.maxdict:
+            pieces.append(self.fillvalue)
+        return "{" + ", ".join(pieces) + "}"
+
+    # the dicts of collections, whatever their size, their own reprs show every item
+
+    def repr_defaultdict(self, x, level: int) -> str:
+        return f"defaultdict({self.repr1(x.default_factory, level - 1)}, {self.repr_dict(x, level)})"
+
+    def repr_OrderedDict(self, x, level: int) -> str:
+        return f"OrderedDict({self.repr_dict(x, level)})"
+
+    def repr_Counter(self, x, level: int) -> str:
+        # in insertion order, not by count
+        return f"Counter({self.repr_dict(x, level)})"
+
+    # the views of dicts build the whole repr too
+
+    def _repr_view(self, x, level: int) -> str:
+        name = type(x).__name__
+        return self._repr_iterable(x, level, name + "([", "])", self.maxlist)
+
+    repr_dict_keys = repr_dict_values = repr_dict_items = _repr_view
+    repr_odict_keys = repr_odict_values = repr_odict_items = _repr_view
+
+    def repr_bytes(self, x: bytes, level: int) -> str:
+        s = builtins.repr(bytes(x[: self.maxstring]))
+        return s if len(x) <= self.maxstring else s[:-1] + "..." + s[-1]
+
+    def repr_bytearray(self, x: bytearray, level: int) -> str:
+        return f"bytearray({self.repr_bytes(x, level)})"
+
+    def repr_int(self, x: int, level: int) -> str:
+        if x.bit_length() > 4 * self.maxother:
+            # about the number of decimal digits, without converting it
+            return f"<int of about {int(x.bit_length() * 0.30103) + 1} digits>"
+        return super().repr_int(x, level)
+
+
+def short_repr(value) -> str:
+    # one BoundedRepr per repr, it holds the budgets of the repr being made
+    return BoundedRepr().repr(value)
+
+
+def display(value):
+    """a sys.displayhook that shows values with `short_repr`"""
+    if value is not None:
+        builtins._ = value
+        print(short_repr(value))
+
+
+def summary(value) -> str:
+    """the type of `value`, and its length, shape, dtype and size when it has them, without looking at the items"""
+    cls = type(value)
+    name = cls.__qualname__ if cls.__module__ == "builtins" else f"{cls.__module__}.{cls.__qualname__}"
+    parts = [name]
+    if hasattr(cls, "__len__"):
+        try:
+            parts.append(f"len={len(value)}")
+        except Exception:
+            pass
+    # arrays of numpy and the libraries that look like it, their properties may raise like any other
+    for attribute in ("shape", "dtype"):
+        if hasattr(cls, attribute):
+            try:
+                parts.append(f"{attribute}={getattr(value, attribute)}")
+            except Exception:
+                pass
+    try:
+        nbytes = getattr(value, "nbytes", None) if hasattr(cls, "nbytes") else None
+    except Exception:
+        nbytes = None
+    if isinstance(nbytes, int):
+        parts.append(f"nbytes={nbytes}")
+    else:
+        # the object itself, not what it refers to
+        try:
+            sizeof = sys.getsizeof(value, None)
+        except Exception:
+            sizeof = None
+        if sizeof is not None:
+            parts.append(f"sizeof={sizeof}")
+    return " ".join(parts)
+
+
+def _iterated(value, start: int, stop: int) -> Iterator[Tuple[str, object]]:
+    return ((f"[{i}]", item) for i, item in enumerate(islice(iter(value), start, stop), start))
+
+
+def _indexed(value, start: int, stop: int) -> Iterator[Tuple[str, object]]:
+    for i in range(start, min(stop, len(value))):
+        try:
+            item = value[i]
+        except Exception:
+            # not a positional index, e.g. the column labels of a DataFrame, or an index that fails
+            yield from _iterated(value, i, stop)
+            return
+        yield f"[{i}]", item
+
+
+def _items(value, start: int, stop: int) -> Optional[Iterator[Tuple[str, object]]]:
+    """(label, item) of the items start to stop of `value`, fetched one at a time, None if it has no items"""
+    if isinstance(value, (str, bytes, bytearray)):
+        step = _CHARS_PER_ITEM
+        return (
+            (f"[{i}:{i + step}]", value[i : i + step])
+            for i in range(start * step, min(stop * step, len(value)), step)
+        )
+    if isinstance(value, Mapping):
+        return ((short_repr(key), value[key]) for key in islice(iter(value), start, stop))
+    cls = type(value)
+    if hasattr(cls, "__len__") and hasattr(cls, "__getitem__"):
+        # sequences and arrays, an item of an array with several dimensions is a row
+        return _indexed(value, start, stop)
+    if hasattr(cls, "__len__") and hasattr(cls, "__iter__"):
+        # sets and views, iterating them does not use them up, unlike iterators
+        return _iterated(value, start, stop)
+    return None
+
+
+def show(value, page: int = 0, size: int = 20, budget: float = TIME_BUDGET):
+    """
+    print a summary of `value`, then page `page` of its items, `size` items (or 64 character chunks of a
+    string) per page, each of them cut like `short_repr`. Items are fetched one at a time, and the page
+    ends early after `budget` seconds, so that a 10M element list or a big array costs no more than a page.
+    Mappings and sets have no index, their items are iterated up to the page.
+    """
+    print(summary(value))
+    try:
+        length = len(value)
+    except Exception:
+        length = None
+    items = _items(value, page * size, (page + 1) * size) if length is not None else None
+    if items is None:
+        print(short_repr(value))
+        return
+    deadline = time.perf_counter() + budget
+    shown = 0
+    try:
+        for label, item in items:
+            print(f"  {label}: {short_repr(item)}")
+            shown += 1
+            if time.perf_counter() > deadline:
+                print(f"  ... stopped after {budget}s")
+                break
+    except Exception as e:
+        # the items of `value` cannot be fetched or iterated, its own repr may still work
+        print(f"  ... {type(e).__name__} getting the items")
+        if not shown:
+            print(short_repr(value))
+        return
+    per_page = size * _CHARS_PER_ITEM if isinstance(value, (str, bytes, bytearray)) else size
+    pages = max(-(-length // per_page), 1)
+    if page + 1 < pages:
+        print(f"page {page} of 0 to {pages - 1}, show(..., page={page + 1}) for the next one")
+    elif not shown and page:
+        print(f"No page {page}, the last one is {pages - 1}")
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+from typing import Sequence
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _has_monitoring() -> bool:
+    return hasattr(sys, "monitoring")
+
+
+# the versions whose exception and return breakpoints are tested, V4 needs sys.monitoring
+EVENT_VERSIONS = ["3", pytest.param("4", marks=pytest.mark.skipif(not _has_monitoring(), reason="Python 3.12+"))]
+
+
+@pytest.fixture
+def nanopdb(tmp_path):
+    """
+    run `source` as a script under `python -m nanopdb [options]`, typing the lines of `commands` at the console,
+    its output
+    """
+
+    def run(version: str, source: str, commands: str, *args: str, options: Sequence[str] = ()) -> str:
+        script = tmp_path / "script.py"
+        script.write_text(textwrap.dedent(source))
+        env = dict(os.environ, NANOPDB_VERSION=version, PYTHONPATH=str(ROOT))
+        proc = subprocess.run(
+            [sys.executable, "-m", "nanopdb", *options, str(script), *args],
+            input="".join(line.strip() + "\n" for line in commands.splitlines()), env=env, cwd=tmp_path, text=True,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60,
+        )
+        return proc.stdout
+
+    return run
@@ -0,0 +1,44 @@
+import json
+import multiprocessing
+
+import pytest
+
+SOURCE = """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+
+    def work(n):
+        total = 0
+        for i in range(n):
+            total += i
+        return total
+
+
+    if __name__ == "__main__":
+        with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("fork")) as pool:
+            print(sum(pool.map(work, [3, 4, 5])))
+"""
+
+needs_fork = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="no fork")
+
+
+@needs_fork
+def test_logpoint_in_forked_child(nanopdb):
+    # the children leave with os._exit, the messages still in their log buffer are flushed before
+    output = nanopdb("3", SOURCE, 'log_at_line(9, "i={i}")\ncont()')
+    messages = sorted(line.split(": ", 1)[1] for line in output.splitlines() if line.startswith("script.py:9:"))
+    assert messages == sorted(f"i={i}" for n in (3, 4, 5) for i in range(n))
+
+
+@needs_fork
+def test_logpoint_in_forked_child_with_commands(nanopdb, tmp_path):
+    session = tmp_path / "session.json"
+    output = tmp_path / "session.jsonl"
+    session.write_text(
+        json.dumps({"output": str(output), "breakpoints": [{"file": "script.py", "line": 9, "log": "i={i}"}]})
+    )
+    nanopdb("3", SOURCE, "", options=["--commands", str(session)])
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    messages = sorted(r["message"] for r in records if r["event"] == "log")
+    assert messages == sorted(f"script.py:9: i={i}" for n in (3, 4, 5) for i in range(n))
@@ -0,0 +1,103 @@
+import pytest
+
+from conftest import EVENT_VERSIONS
+
+SOURCE = """
+    import os
+
+
+    def in_finally():
+        try:
+            raise KeyError("finally")
+        finally:
+            x = 1
+
+
+    def in_with():
+        with open(os.devnull):
+            raise KeyError("with")
+
+
+    def in_except():
+        try:
+            raise KeyError("except")
+        except KeyError:
+            y = 2
+        return y
+
+
+    def in_generator():
+        try:
+            raise KeyError("generator")
+        except KeyError:
+            yield 1
+            yield 2
+
+
+    def main():
+        for f in (in_finally, in_with):
+            try:
+                f()
+            except KeyError:
+                z = 3
+        list(in_generator())
+        return in_except()
+
+
+    main()
+"""
+
+COMMANDS = """
+    break_on_exception("KeyError", "caught")
+    break_on_return("in_finally")
+    break_on_return("in_with")
+    break_on_return("in_except")
+""" + "cont()\n" * 8
+
+
+@pytest.mark.parametrize("version", EVENT_VERSIONS)
+def test_caught_only_where_not_raised_again(nanopdb, version):
+    output = nanopdb(version, SOURCE, COMMANDS)
+    caught = [line.split(">>> ")[-1] for line in output.splitlines() if " caught: " in line]
+    # a `finally` body and the exit of a `with` raise it again, main catches it; nothing runs after the
+    # handler of the generator but its return
+    assert caught == [
+        "KeyError caught: 'finally'",
+        "KeyError caught: 'with'",
+        "KeyError caught: 'generator'",
+        "KeyError caught: 'except'",
+    ]
+    assert "breakpoint at script.py:34 (main)" in output
+    assert "breakpoint at script.py:30 (in_generator)" in output
+    assert "breakpoint at script.py:22 (in_except)" in output
+
+
+@pytest.mark.parametrize("version", EVENT_VERSIONS)
+def test_no_return_value_when_leaving_by_exception(nanopdb, version):
+    output = nanopdb(version, SOURCE, COMMANDS)
+    assert "in_finally returns" not in output
+    assert "in_with returns" not in output
+    assert "in_except returns 2" in output
+
+
+@pytest.mark.parametrize("version", EVENT_VERSIONS)
+def test_return_in_finally_is_caught(nanopdb, version):
+    source = """
+        def swallow():
+            try:
+                raise KeyError("lost")
+            finally:
+                return 5
+
+
+        swallow()
+        raise KeyError("top")
+    """
+    commands = """
+        break_on_exception("KeyError", "caught")
+        break_on_return("swallow")
+    """ + "cont()\n" * 4
+    output = nanopdb(version, source, commands)
+    assert "KeyError caught: 'lost'" in output
+    assert "swallow returns 5" in output
+    assert "caught: 'top'" not in output
@@ -0,0 +1,29 @@
+import pytest
+
+SOURCE = """
+    def fib(n):
+        if n <= 1:
+            return n
+        return fib(n - 1) + fib(n - 2)
+
+
+    print(fib(6))
+"""
+
+COMMANDS = """
+    break_at_function("fib", "n == 3")
+    cont()
+    print("stopped", n)
+    cont()
+"""
+
+
+@pytest.mark.parametrize("options", [[], ["--record"], ["--record-locals"]])
+def test_function_breakpoint_while_recording(nanopdb, options):
+    output = nanopdb("3", SOURCE, COMMANDS, options=options)
+    assert "stopped 3" in output
+
+
+def test_function_breakpoint_after_record_helper(nanopdb):
+    output = nanopdb("3", SOURCE, "record()\n" + COMMANDS)
+    assert "stopped 3" in output
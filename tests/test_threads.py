@@ -0,0 +1,22 @@
+SOURCE = """
+    from concurrent.futures import ThreadPoolExecutor
+
+
+    def work(n):
+        total = 0
+        for i in range(n):
+            total += i
+        return total
+
+
+    with ThreadPoolExecutor(2) as pool:
+        print(sum(pool.map(work, [10, 20])))
+"""
+
+
+def test_profile_here_in_a_worker_thread(nanopdb):
+    output = nanopdb("3", SOURCE, 'break_at_line(8, "i == 5 and n == 10")\ncont()\nprofile_here()\ncont()')
+    assert "in thread ThreadPoolExecutor" in output
+    assert "profile_here() only works at a stop in the main thread" in output
+    assert "Traceback" not in output
+    assert "235" in output
@@ -0,0 +1,121 @@
+import time
+import tracemalloc
+
+import pytest
+
+from nanopdb.values import BoundedRepr, short_repr, show, summary
+
+N = 10_000_000
+
+
+@pytest.fixture(scope="module")
+def big_dict():
+    return dict.fromkeys(range(N), 0)
+
+
+@pytest.fixture(scope="module")
+def big_set(big_dict):
+    return set(big_dict)
+
+
+def _cost(value):
+    """seconds and peak bytes allocated of short_repr(value), and the repr"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        s = short_repr(value)
+        return time.perf_counter() - start, tracemalloc.get_traced_memory()[1], s
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize(
+    "make, start",
+    [
+        (lambda d, s: d, "{0: 0, 1: 0, "),
+        (lambda d, s: s, "{0, 1, 2, "),
+        (lambda d, s: frozenset(s), "frozenset({0, 1, "),
+        (lambda d, s: d.items(), "dict_items([(0, 0), (1, 0), "),
+        (lambda d, s: d.keys(), "dict_keys([0, 1, "),
+        (lambda d, s: d.values(), "dict_values([0, 0, "),
+    ],
+)
+def test_huge_dicts_sets_and_views_are_not_walked(big_dict, big_set, make, start):
+    seconds, peak, s = _cost(make(big_dict, big_set))
+    assert seconds < 0.1
+    assert peak < 1_000_000
+    assert s.startswith(start)
+    assert s.rstrip("])}").endswith(", ...")
+
+
+def test_dicts_keep_insertion_order():
+    assert short_repr({"b": 1, "a": 2}) == "{'b': 1, 'a': 2}"
+
+
+def test_nested_repr_is_bounded():
+    value = [[["x" * 300] * 60 for _ in range(60)] for _ in range(60)]
+    assert len(short_repr(value)) <= 4000
+
+
+def test_small_values_keep_their_repr():
+    assert short_repr([1, 2, {"a": (3, 4)}]) == "[1, 2, {'a': (3, 4)}]"
+
+
+def test_repr_stops_after_its_time_budget():
+    class Slow:
+        def __repr__(self):
+            time.sleep(0.02)
+            return "slow"
+
+    start = time.perf_counter()
+    s = BoundedRepr(budget=0.1).repr([Slow() for _ in range(40)])
+    assert time.perf_counter() - start < 0.5
+    assert s.startswith("[slow, ") and s.endswith("...]")
+
+
+class Frame:
+    """indexed by column label like a DataFrame, iterating it gives the labels"""
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, key):
+        return {"a": [1, 2], "b": [3, 4]}[key]
+
+    def __iter__(self):
+        return iter("ab")
+
+    @property
+    def shape(self):
+        raise RuntimeError("no shape")
+
+    @property
+    def dtype(self):
+        return "object"
+
+
+def test_summary_skips_attributes_that_raise():
+    assert summary(Frame()).startswith(f"{__name__}.Frame len=2 dtype=object ")
+
+
+def test_show_iterates_when_indexing_fails(capsys):
+    show(Frame())
+    assert capsys.readouterr().out.splitlines()[1:] == ["  [0]: 'a'", "  [1]: 'b'"]
+
+
+def test_show_falls_back_to_repr(capsys):
+    class Broken:
+        def __len__(self):
+            return 1
+
+        def __getitem__(self, i):
+            raise IndexError(i)
+
+        def __iter__(self):
+            raise TypeError("not iterable")
+
+        def __repr__(self):
+            return "<Broken>"
+
+    show(Broken())
+    assert capsys.readouterr().out.splitlines()[1:] == ["  ... TypeError getting the items", "<Broken>"]